@@ -0,0 +1,160 @@
+"""
+Generic in-memory caches used through application
+"""
+
+# Library includes
+from collections import OrderedDict
+import time
+
+
+# Marker used to tell apart omitted argument from None
+_DEFAULT = object()
+
+
+class _CacheEntry:
+    """
+    Single cached value together with its expiration time
+    """
+    __slots__ = ('value', 'expires_at', 'negative')
+
+    def __init__(self, value, expires_at: float, negative: bool) -> None:
+        self.value = value
+        self.expires_at: float = expires_at
+        self.negative: bool = negative
+
+
+class TTLCache:
+    """
+    Size bounded cache with least recently used eviction where every entry
+    expires after a given time.
+    Expired entries are kept until they are evicted or overwritten so their last known value
+    can still be obtained through peek()
+
+    Args:
+        max_size (int): maximal number of entries held by the cache
+        ttl (float, optional): time in seconds after which entry expires, None means never
+        negative_ttl (float, optional): time to live of negative entries. Defaults to ttl
+    """
+
+    def __init__(self, *, max_size: int, ttl: float = None, negative_ttl: float = _DEFAULT) -> None:
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        self.negative_ttl: float = ttl if negative_ttl is _DEFAULT else negative_ttl
+
+        self._entries: OrderedDict = OrderedDict()
+
+        # Statistics
+        self.hits: int = 0
+        self.negative_hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def get(self, key, default=None):
+        """
+        Returns cached value if it exists and did not expire, otherwise returns default
+
+        Args:
+            key (Hashable): key of the entry
+            default (optional): Value returned on cache miss. Defaults to None.
+        """
+        entry: _CacheEntry = self._entries.get(key)
+
+        if entry is None or _is_expired(entry):
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+
+        if entry.negative:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+
+        return entry.value
+
+    def peek(self, key, default=None):
+        """
+        Returns cached value even if it has expired. Does not affect statistics nor eviction order
+
+        Args:
+            key (Hashable): key of the entry
+            default (optional): Value returned if there is no entry. Defaults to None.
+        """
+        entry: _CacheEntry = self._entries.get(key)
+
+        if entry is None:
+            return default
+
+        return entry.value
+
+    def set(self, key, value, *, negative: bool = False, ttl: float = _DEFAULT) -> None:
+        """
+        Stores value in the cache evicting least recently used entries when the cache is full
+
+        Args:
+            key (Hashable): key of the entry
+            value: value to be cached
+            negative (bool, optional): Marks that the value represents missing data.
+                Negative entries use negative_ttl. Defaults to False.
+            ttl (float, optional): Overrides time to live of this entry, None means never
+        """
+        if ttl is _DEFAULT:
+            ttl = self.negative_ttl if negative else self.ttl
+
+        expires_at: float = None if ttl is None else time.monotonic() + ttl
+
+        self._entries[key] = _CacheEntry(value, expires_at, negative)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def evict(self, key) -> bool:
+        """
+        Removes entry from the cache
+
+        Args:
+            key (Hashable): key of the entry
+
+        Returns:
+            bool: True if the entry existed
+        """
+        if self._entries.pop(key, None) is None:
+            return False
+
+        self.evictions += 1
+        return True
+
+    def clear(self) -> None:
+        """
+        Removes all entries from the cache
+        """
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns cache statistics
+
+        Returns:
+            dict: size, hits, negative hits, misses and evictions counters
+        """
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def __contains__(self, key) -> bool:
+        entry: _CacheEntry = self._entries.get(key)
+        return entry is not None and not _is_expired(entry)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _is_expired(entry: _CacheEntry) -> bool:
+    return entry.expires_at is not None and entry.expires_at <= time.monotonic()
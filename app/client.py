@@ -3,17 +3,31 @@ This module contains client class BotClient which is used to communicate with Di
 """
 # Lib includes
 from pathlib import Path
+from collections import Counter
+from typing import Awaitable, Callable, List
 import asyncio
 
 from discord.ext import commands
 import discord
 
 # App includes
+import app.configuration as configuration
 from .logging.core import Log
-from .prefix_handler import get_server_prefix
+from .prefix_handler import prefix_cache, prefix_matcher, PrefixMatcher
+from .prefix_handler import start_prefix_listener, stop_prefix_listener
+from .cache import TTLCache
+from .write_behind import write_queue, WriteBehindQueue
+from .deletion_service import DeletionService
+from .fanout import FanoutSender
+from .conversation import ConversationDispatcher
 from .help_command import MyHelp
 
 
+# Types of messages that are written by users
+_COMMAND_MESSAGE_TYPES: frozenset = frozenset(
+    (discord.MessageType.default, discord.MessageType.reply))
+
+
 class BotClient(commands.Bot):
     """
     The main client used in application to communicate with Discord API.
@@ -40,6 +54,32 @@ class BotClient(commands.Bot):
         # Bind logger
         self.log: Log = Log
 
+        # Bind server prefix cache
+        self.prefix_cache: TTLCache = prefix_cache
+        self.prefix_matcher: PrefixMatcher = prefix_matcher
+
+        # Bind queue of firestore writes
+        self.write_queue: WriteBehindQueue = write_queue
+
+        # Deletes messages enqueued by cogs after a delay
+        self.deletion_service: DeletionService = DeletionService()
+
+        # Sends direct messages to many users at once
+        self.fanout: FanoutSender = FanoutSender(self)
+
+        # Routes replies to open multi-step conversations
+        self.conversations: ConversationDispatcher = ConversationDispatcher()
+
+        # Channels in which messages are never processed
+        self.ignored_channels: frozenset = frozenset(
+            configuration.get_config().ignored_channels)
+
+        # Number of messages dropped by each prefilter stage
+        self.prefilter_stats: Counter = Counter()
+
+        # Coroutine functions of extensions awaited on close before pending writes are committed
+        self.close_hooks: List[Callable[[], Awaitable]] = []
+
         # Read discord token file
         token_file = Path('.discord')
 
@@ -69,7 +109,7 @@ class BotClient(commands.Bot):
 
             if file_name.endswith('.py'):
                 cog_name: str = f'cogs.{file_name[:-3]}'
-                Log.warning(f'\tloading cog: {cog_name}')
+                Log.warning('\tloading cog: %s', cog_name)
                 self.load_extension(cog_name)
 
         Log.warning('Finished loading cogs')
@@ -83,9 +123,70 @@ class BotClient(commands.Bot):
         Shorthand for login() and connect()
         """
 
+        # Keep prefixes in sync with other bot processes
+        if configuration.get_config().prefix_live_updates:
+            start_prefix_listener()
+
         await self.login(self.token, bot=True)
         await self.connect(reconnect=True)
 
+    async def on_ready(self) -> None:
+        """
+        Binds the bot user to mention prefixes once the bot logs in
+        """
+        self.prefix_matcher.bind_user(self.user.id)
+
+    async def on_message(self, message: discord.Message) -> None:
+        """
+        Routes the message to open conversation or processes commands from it
+        unless it gets dropped by the prefilter
+
+        Args:
+            message (discord.Message): received message
+        """
+        if self.conversations.dispatch(message):
+            self.prefilter_stats['conversation'] += 1
+            return
+
+        dropped_by: str = self._prefilter(message)
+
+        if dropped_by is not None:
+            self.prefilter_stats[dropped_by] += 1
+            return
+
+        self.prefilter_stats['passed'] += 1
+        await self.process_commands(message)
+
+    def _prefilter(self, message: discord.Message) -> str:
+        """
+        Cheap checks rejecting messages that can't invoke any command,
+        ran before the context is built
+
+        Args:
+            message (discord.Message): received message
+
+        Returns:
+            str: name of the stage that dropped the message, None if message passed
+        """
+        if message.author.bot:
+            return 'bot'
+
+        if message.webhook_id is not None:
+            return 'webhook'
+
+        if message.type not in _COMMAND_MESSAGE_TYPES:
+            return 'system'
+
+        if message.channel.id in self.ignored_channels:
+            return 'ignored_channel'
+
+        guild_id: int = message.guild.id if message.guild is not None else None
+
+        if not self.prefix_matcher.could_match(guild_id, message.content):
+            return 'no_prefix'
+
+        return None
+
     def run(self, *args, **kwargs) -> None:
         """
         Activates and runs the event loop
@@ -100,7 +201,24 @@ class BotClient(commands.Bot):
         Cleaning up and closing the event loop
         """
         Log.error('Logging out of discord')
-        return await super().close()
+        stop_prefix_listener()
+
+        for hook in self.close_hooks:
+            try:
+                await hook()
+            except Exception as exc:  # pylint: disable=broad-except
+                Log.error('Close hook %s failed: %s', hook, exc)
+
+        # Commit writes that are still pending
+        await self.write_queue.close()
+
+        # Delete messages that are still waiting for deletion
+        await self.deletion_service.close()
+
+        await super().close()
+
+        # Write log messages that are still queued
+        Log.shutdown()
 
     @staticmethod
     def get_instance():
@@ -119,26 +237,6 @@ class BotClient(commands.Bot):
         return BotClient._INSTANCE
 
 
-def _get_prefix(bot: BotClient, msg: discord.Message):
-    bot_user_id = bot.user.id
-
-    # Standard prefixes for direct ping @BOTNAME
-    prefixes: list = [f'<@!{bot_user_id}> ', f'<@{bot_user_id} ']
-
-    # Check if it is a private channel
-    if msg.guild is None:
-        prefixes.append('!')
-        prefixes.append('?')
-        Log.debug('Getting prefix for private DM')
-    else:
-        Log.debug(f'Getting prefix for server: {msg.guild.name}')
-        guild_id: int = msg.guild.id
-        custom_prefix: str = get_server_prefix(guild_id)
-
-        # Check if the prefix is not an empty string
-        if custom_prefix:
-            prefixes.append(custom_prefix)
-        else:
-            prefixes.append('?')
-
-    return prefixes
+def _get_prefix(bot: BotClient, msg: discord.Message) -> tuple:
+    guild_id: int = msg.guild.id if msg.guild is not None else None
+    return bot.prefix_matcher.get_prefixes(guild_id)
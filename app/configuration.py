@@ -33,6 +33,23 @@ class Config:
 
         library_logging_type [CONSOLE/FILE]
 
+        file_rotation       [NONE/SIZE/DAILY]
+        file_max_size       [positive int, bytes]
+        file_backup_count   [non-negative int]
+        file_compress       [true/false]
+        file_format         [TEXT/JSON]
+
+        log_async           [true/false]
+        log_queue_size      [positive int]
+        log_queue_policy    [DROP/BLOCK]
+
+        log_buffer_size     [non-negative int, 0 disables the buffer]
+        log_buffer_level    [DEBUG/INFO/WARNING/ERROR/CRITICAL]
+
+        prefix_live_updates [true/false]
+
+        ignored_channels    [list of channel ids]
+
         command_prefix      [char]
 
     """
@@ -89,6 +106,77 @@ class Config:
         except KeyError:
             self.library_log_level: int = None
 
+        # file_rotation -
+        #   enum [NONE/SIZE/DAILY] None if out of bounds or not found
+        try:
+            self.file_rotation: int = LogRotation[configuration['file_rotation']].value
+        except KeyError:
+            self.file_rotation: int = None
+
+        # file_max_size -
+        #   int [positive int] None if out of bounds or not found
+        file_max_size = configuration.get('file_max_size', None)
+        self.file_max_size: int = file_max_size if isinstance(
+            file_max_size, int) and file_max_size > 0 else None
+
+        # file_backup_count -
+        #   int [non-negative int] None if out of bounds or not found
+        file_backup_count = configuration.get('file_backup_count', None)
+        self.file_backup_count: int = file_backup_count if isinstance(
+            file_backup_count, int) and file_backup_count >= 0 else None
+
+        # file_compress -
+        #   bool [true/false] None if out of bounds or not found
+        self.file_compress: bool = configuration.get('file_compress', None)
+
+        # file_format -
+        #   enum [TEXT/JSON] None if out of bounds or not found
+        try:
+            self.file_format: int = LogFileFormat[configuration['file_format']].value
+        except KeyError:
+            self.file_format: int = None
+
+        # log_async -
+        #   bool [true/false] None if out of bounds or not found
+        self.log_async: bool = configuration.get('log_async', None)
+
+        # log_queue_size -
+        #   int [positive int] None if out of bounds or not found
+        log_queue_size = configuration.get('log_queue_size', None)
+        self.log_queue_size: int = log_queue_size if isinstance(
+            log_queue_size, int) and log_queue_size > 0 else None
+
+        # log_queue_policy -
+        #   enum [DROP/BLOCK] None if out of bounds or not found
+        try:
+            self.log_queue_policy: int = LogQueuePolicy[configuration['log_queue_policy']].value
+        except KeyError:
+            self.log_queue_policy: int = None
+
+        # log_buffer_size -
+        #   int [non-negative int] None if out of bounds or not found
+        log_buffer_size = configuration.get('log_buffer_size', None)
+        self.log_buffer_size: int = log_buffer_size if isinstance(
+            log_buffer_size, int) and log_buffer_size >= 0 else None
+
+        # log_buffer_level -
+        #   enum [DEBUG/INFO/WARNING/ERROR/CRITICAL] None if out of bounds or not found
+        try:
+            self.log_buffer_level: int = LoggingLevels[configuration['log_buffer_level']].value
+        except KeyError:
+            self.log_buffer_level: int = None
+
+        # prefix_live_updates -
+        #   bool [true/false] None if out of bounds or not found
+        self.prefix_live_updates: bool = configuration.get(
+            'prefix_live_updates', None)
+
+        # ignored_channels -
+        #   list [channel ids] None if out of bounds or not found
+        ignored_channels = configuration.get('ignored_channels', None)
+        self.ignored_channels: list = ignored_channels if isinstance(
+            ignored_channels, list) else None
+
 
 # Configuration holders
 _app_configuration: Config = None
@@ -271,6 +359,33 @@ class LogOutputType(Enum):
     FILE = 1
 
 
+class LogRotation(Enum):
+    """
+    Enum that represents when log files are rotated, either never, after reaching maximal size
+    or every midnight
+    """
+    NONE = 0
+    SIZE = 1
+    DAILY = 2
+
+
+class LogFileFormat(Enum):
+    """
+    Enum that represents format of log files, either human readable lines or JSON lines
+    """
+    TEXT = 0
+    JSON = 1
+
+
+class LogQueuePolicy(Enum):
+    """
+    Enum that represents what happens to log message when the asynchronous logging queue is full,
+    either the message is dropped or the logging thread waits for free space
+    """
+    DROP = 0
+    BLOCK = 1
+
+
 class LoggingLevels(Enum):
     """
     Enum that represents conversion from string description of log level
@@ -0,0 +1,128 @@
+"""
+Routing of user replies to multi-step conversations (wizards).
+Open conversations are indexed by (channel id, author id) so every incoming message
+is routed with single dictionary lookup regardless of how many conversations are open
+"""
+
+# Library includes
+import asyncio
+
+import discord
+
+
+class Conversation:
+    """
+    Conversation with single user in single channel. Replies received while the conversation
+    is not waiting are queued, so no reply is lost between the steps
+
+    Args:
+        dispatcher (ConversationDispatcher): dispatcher the conversation belongs to
+        key (tuple): (channel id, author id)
+    """
+
+    def __init__(self, dispatcher: 'ConversationDispatcher', key: tuple) -> None:
+        self._dispatcher: ConversationDispatcher = dispatcher
+        self.key: tuple = key
+        self.replies: asyncio.Queue = asyncio.Queue()
+
+    async def wait_for_reply(self, timeout: float) -> discord.Message:
+        """
+        Coroutine that waits for the next reply
+
+        Args:
+            timeout (float): seconds to wait
+
+        Raises:
+            asyncio.TimeoutError: If the user did not reply in time
+
+        Returns:
+            discord.Message: the reply
+        """
+        return await asyncio.wait_for(self.replies.get(), timeout=timeout)
+
+    def close(self) -> None:
+        """
+        Stops routing replies to this conversation
+        """
+        self._dispatcher.close(self)
+
+    async def __aenter__(self) -> 'Conversation':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+
+class ConversationDispatcher:
+    """
+    Index of open conversations keyed by (channel id, author id)
+    """
+
+    def __init__(self) -> None:
+        self._conversations: dict = {}
+
+    def open(self, channel_id: int, author_id: int) -> Conversation:
+        """
+        Opens conversation with the user in the channel. Can be used as async context manager
+        which closes the conversation on exit
+
+        Args:
+            channel_id (int): channel id
+            author_id (int): user id
+
+        Raises:
+            ConversationAlreadyOpen: If the user has open conversation in the channel
+
+        Returns:
+            Conversation: opened conversation
+        """
+        key: tuple = (channel_id, author_id)
+
+        if key in self._conversations:
+            raise ConversationAlreadyOpen(channel_id, author_id)
+
+        conversation = Conversation(self, key)
+        self._conversations[key] = conversation
+        return conversation
+
+    def close(self, conversation: Conversation) -> None:
+        """
+        Closes the conversation
+
+        Args:
+            conversation (Conversation): conversation to be closed
+        """
+        if self._conversations.get(conversation.key) is conversation:
+            del self._conversations[conversation.key]
+
+    def dispatch(self, message: discord.Message) -> bool:
+        """
+        Routes the message to conversation of its author in its channel
+
+        Args:
+            message (discord.Message): received message
+
+        Returns:
+            bool: True if the message was consumed by a conversation
+        """
+        conversation: Conversation = self._conversations.get(
+            (message.channel.id, message.author.id))
+
+        if conversation is None:
+            return False
+
+        conversation.replies.put_nowait(message)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+
+class ConversationAlreadyOpen(Exception):
+    """
+    Raised when opening second conversation with the same user in the same channel
+    """
+
+    def __init__(self, channel_id: int, author_id: int):
+        message = f'User {author_id} already has open conversation in channel {channel_id}'
+        super().__init__(message)
@@ -0,0 +1,158 @@
+"""
+Bot-wide service deleting messages after a delay.
+Due messages are grouped per channel and removed with bulk delete
+so a whole conversation costs single HTTP request instead of one per message
+"""
+
+# Library includes
+from datetime import datetime, timedelta
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Iterable
+
+import discord
+
+# App includes
+from .logging.core import Log
+
+
+# Maximal number of messages removed by single bulk delete
+BULK_DELETE_LIMIT: int = 100
+
+# Discord refuses to bulk delete messages older than 14 days, keep a safety margin
+BULK_DELETE_MAX_AGE: timedelta = timedelta(days=14) - timedelta(minutes=5)
+
+# Seconds to wait after unexpected error before serving the queue again
+RETRY_DELAY: float = 5.0
+
+
+class DeletionService:
+    """
+    Deletes enqueued messages once their delay passes without holding the caller coroutine.
+    Messages are kept in a min-heap ordered by deletion time and served by single task
+    """
+
+    def __init__(self) -> None:
+        # Heap of (deletion time, sequence, message)
+        self._heap: list = []
+        self._sequence = itertools.count()
+
+        self._runner: asyncio.Task = None
+        self._wakeup: asyncio.Event = None
+
+        # Statistics
+        self.deleted: int = 0
+        self.requests: int = 0
+
+    def schedule(self, messages: Iterable[discord.Message], delay: float) -> None:
+        """
+        Enqueues messages for deletion
+
+        Args:
+            messages (Iterable[discord.Message]): messages to be deleted
+            delay (float): seconds after which the messages are deleted
+        """
+        deadline: float = time.monotonic() + delay
+        earliest: float = self._heap[0][0] if self._heap else None
+
+        for message in messages:
+            heapq.heappush(self._heap, (deadline, next(self._sequence), message))
+
+        if self._runner is None:
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.ensure_future(self._run())
+        elif earliest is None or deadline < earliest:
+            self._wakeup.set()
+
+    async def close(self) -> None:
+        """
+        Coroutine that stops the service and deletes every enqueued message right away
+        """
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+
+        due: list = [message for _, _, message in self._heap]
+        self._heap.clear()
+        await self._delete(due)
+
+    async def _run(self) -> None:
+        # Single runner serves every guild, so no error may stop it
+        while True:
+            try:
+                await self._step()
+            except Exception:  # pylint: disable=broad-except
+                Log.error('Deletion service failed, retrying', exc_info=True)
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def _step(self) -> None:
+        """
+        Deletes every due message or waits for the earliest one
+        """
+        if not self._heap:
+            timeout: float = None
+        else:
+            timeout = self._heap[0][0] - time.monotonic()
+
+        if timeout is None or timeout > 0:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        # Take every message that is due
+        now: float = time.monotonic()
+        due: list = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+
+        await self._delete(due)
+
+    async def _delete(self, messages: list) -> None:
+        # Group messages by channel
+        channels: dict = {}
+        for message in messages:
+            channels.setdefault(message.channel.id, []).append(message)
+
+        oldest_bulk: datetime = datetime.utcnow() - BULK_DELETE_MAX_AGE
+
+        for channel_messages in channels.values():
+            channel = channel_messages[0].channel
+
+            if isinstance(channel, discord.TextChannel):
+                recent: list = [
+                    message for message in channel_messages if message.created_at > oldest_bulk]
+                single: list = [
+                    message for message in channel_messages if message.created_at <= oldest_bulk]
+            else:
+                # Bulk delete is only available in guild text channels
+                recent, single = [], channel_messages
+
+            for start in range(0, len(recent), BULK_DELETE_LIMIT):
+                chunk: list = recent[start:start + BULK_DELETE_LIMIT]
+
+                try:
+                    await channel.delete_messages(chunk)
+                except (discord.Forbidden, discord.HTTPException) as exc:
+                    Log.warning('Bulk delete in channel %s failed: %s', channel.id, exc)
+                    single.extend(chunk)
+                    continue
+
+                self.requests += 1
+                self.deleted += len(chunk)
+
+            for message in single:
+                try:
+                    await message.delete()
+                except discord.NotFound:
+                    pass
+                except (discord.Forbidden, discord.HTTPException) as exc:
+                    Log.warning('Could not delete message %s: %s', message.id, exc)
+                    continue
+
+                self.requests += 1
+                self.deleted += 1
@@ -0,0 +1,136 @@
+"""
+Bot-wide sender of direct messages to many users at once.
+Messages are delivered by bounded pool of workers sharing rate limiters,
+users that do not accept direct messages are remembered and skipped
+"""
+
+# Library includes
+from collections import Counter
+from typing import Iterable, NamedTuple
+import asyncio
+import time
+
+import discord
+
+# App includes
+from .cache import TTLCache
+from .logging.core import Log
+from .rate_limit import TokenBucket
+
+
+# Number of workers delivering messages of single fan-out
+FANOUT_WORKERS: int = 10
+
+# Direct messages sent per second by all fan-outs together, below discord global limit
+FANOUT_RATE: float = 25.0
+
+# Direct message channels opened per second, all of them share single discord route
+DM_OPEN_RATE: float = 5.0
+
+# Maximal number of remembered users with closed direct messages
+CLOSED_DM_CACHE_SIZE: int = 100000
+
+# Seconds after which user with closed direct messages is tried again
+CLOSED_DM_TTL: float = 86400.0
+
+
+class FanoutResult(NamedTuple):
+    """
+    Delivery report of single fan-out
+    """
+    delivered: int
+    skipped: int
+    failed: int
+    elapsed: float
+
+
+class FanoutSender:
+    """
+    Delivers the same message to many users with limited concurrency and request rate
+
+    Args:
+        client (discord.Client): client used to look up users
+        workers (int, optional): workers of single fan-out. Defaults to FANOUT_WORKERS.
+    """
+
+    def __init__(self, client: discord.Client, *, workers: int = FANOUT_WORKERS) -> None:
+        self.client: discord.Client = client
+        self.workers: int = workers
+
+        self._send_limit = TokenBucket(FANOUT_RATE)
+        self._open_limit = TokenBucket(DM_OPEN_RATE)
+
+        # user id -> True for users whose direct messages are closed
+        self.closed_dms: TTLCache = TTLCache(max_size=CLOSED_DM_CACHE_SIZE, ttl=CLOSED_DM_TTL)
+
+        # Statistics of all fan-outs
+        self.stats: Counter = Counter()
+
+    async def send(self, user_ids: Iterable[int], content: str = None,
+                   embed: discord.Embed = None) -> FanoutResult:
+        """
+        Coroutine that sends direct message to every user
+
+        Args:
+            user_ids (Iterable[int]): ids of the recipients
+            content (str, optional): message content
+            embed (discord.Embed, optional): message embed
+
+        Returns:
+            FanoutResult: delivery report
+        """
+        started: float = time.monotonic()
+        result: Counter = Counter()
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for user_id in user_ids:
+            if user_id in self.closed_dms:
+                result['skipped'] += 1
+            else:
+                queue.put_nowait(user_id)
+
+        async def worker() -> None:
+            while not queue.empty():
+                outcome: str = await self._deliver(queue.get_nowait(), content, embed)
+                result[outcome] += 1
+
+        workers: int = min(self.workers, queue.qsize())
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+        self.stats.update(result)
+        self.stats['fanouts'] += 1
+
+        report = FanoutResult(
+            delivered=result['delivered'],
+            skipped=result['skipped'],
+            failed=result['failed'],
+            elapsed=time.monotonic() - started
+        )
+        Log.info('Fan-out finished: %s', report)
+        return report
+
+    async def _deliver(self, user_id: int, content: str, embed: discord.Embed) -> str:
+        try:
+            user: discord.User = self.client.get_user(user_id)
+            if user is None:
+                await self._send_limit.acquire()
+                user = await self.client.fetch_user(user_id)
+
+            channel: discord.DMChannel = user.dm_channel
+            if channel is None:
+                await self._open_limit.acquire()
+                channel = await user.create_dm()
+
+            await self._send_limit.acquire()
+            await channel.send(content, embed=embed)
+        except discord.Forbidden:
+            # Direct messages are closed or the user blocked the bot, next fan-outs skip the user
+            self.closed_dms.set(user_id, True)
+            return 'failed'
+        except discord.NotFound:
+            return 'failed'
+        except discord.HTTPException as exc:
+            Log.warning('Could not send direct message to user %s: %s', user_id, exc)
+            return 'failed'
+
+        return 'delivered'
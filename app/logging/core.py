@@ -4,6 +4,7 @@ logging capabilities through application
 """
 
 # Library includes
+import atexit
 import os
 import logging
 from sys import stdout
@@ -13,6 +14,10 @@ import coloredlogs
 
 # App includes
 import app.configuration as configuration
+from .log_queue import LogQueue
+from .ring_buffer import LogRingBuffer
+from .file_handlers import JsonLinesFormatter, close_compressor, create_file_handler
+from .throttle import LogThrottle
 
 # Styles
 logging_format: str = "%(asctime)s | %(name)s[%(process)d] %(levelname)s: %(message)s"
@@ -58,6 +63,8 @@ class LogContainer:
 
     def __init__(self, *, name, level=logging.INFO) -> None:
 
+        self.name: str = name
+
         # Get app configuration
         self.app_config = configuration.get_config()
 
@@ -75,10 +82,50 @@ class LogContainer:
                 use_color=self.app_config.console_use_color)
             self.active_loggers.append(logger_instance)
 
+        # Custom loggers write through the same background thread as the main ones
+        if Log.log_queue is not None:
+            for logger_instance in self.active_loggers:
+                Log.log_queue.attach(logger_instance)
+
+        # Messages below this level are discarded with single comparison,
+        # messages below output level are only captured by the ring buffer
+        self.output_level: int = _min_level(self.active_loggers)
+        self.min_level: int = _capture_level(self.output_level, Log.ring_buffer)
+
+        # Rate limits and sampling of call sites of this logger
+        self.throttle = LogThrottle(
+            lambda level, key, suppressed: _report_suppressed(
+                self.active_loggers, level, key, suppressed))
+
+    def enabled_for(self, level: int) -> bool:
+        """
+        Checks whether message of given level would be printed or captured,
+        used to skip building expensive log arguments
+
+        Args:
+            level (int): logging level
+
+        Returns:
+            bool: True if some logger prints messages of the level or the ring buffer keeps them
+        """
+        return level >= self.min_level
+
     def debug(self, *args, **kwargs):
         """
         Print debug message
         """
+        if logging.DEBUG < self.min_level:
+            return
+
+        if kwargs and _throttled(self.throttle, logging.DEBUG, args, kwargs):
+            return
+
+        if Log.ring_buffer is not None:
+            Log.ring_buffer.record(logging.DEBUG, self.name, args, kwargs)
+
+        if logging.DEBUG < self.output_level:
+            return
+
         # Assert that there are available loggers
         assert self.active_loggers
 
@@ -89,6 +136,18 @@ class LogContainer:
         """
         Print info message
         """
+        if logging.INFO < self.min_level:
+            return
+
+        if kwargs and _throttled(self.throttle, logging.INFO, args, kwargs):
+            return
+
+        if Log.ring_buffer is not None:
+            Log.ring_buffer.record(logging.INFO, self.name, args, kwargs)
+
+        if logging.INFO < self.output_level:
+            return
+
         # Assert that there are available loggers
         assert self.active_loggers
 
@@ -99,6 +158,18 @@ class LogContainer:
         """
         Print warning message
         """
+        if logging.WARNING < self.min_level:
+            return
+
+        if kwargs and _throttled(self.throttle, logging.WARNING, args, kwargs):
+            return
+
+        if Log.ring_buffer is not None:
+            Log.ring_buffer.record(logging.WARNING, self.name, args, kwargs)
+
+        if logging.WARNING < self.output_level:
+            return
+
         # Assert that there are available loggers
         assert self.active_loggers
 
@@ -109,6 +180,18 @@ class LogContainer:
         """
         Print error message
         """
+        if logging.ERROR < self.min_level:
+            return
+
+        if kwargs and _throttled(self.throttle, logging.ERROR, args, kwargs):
+            return
+
+        if Log.ring_buffer is not None:
+            Log.ring_buffer.record(logging.ERROR, self.name, args, kwargs)
+
+        if logging.ERROR < self.output_level:
+            return
+
         # Assert that there are available loggers
         assert self.active_loggers
 
@@ -119,6 +202,18 @@ class LogContainer:
         """
         Print critical message
         """
+        if logging.CRITICAL < self.min_level:
+            return
+
+        if kwargs and _throttled(self.throttle, logging.CRITICAL, args, kwargs):
+            return
+
+        if Log.ring_buffer is not None:
+            Log.ring_buffer.record(logging.CRITICAL, self.name, args, kwargs)
+
+        if logging.CRITICAL < self.output_level:
+            return
+
         # Assert that there are available loggers
         assert self.active_loggers
 
@@ -133,6 +228,25 @@ class Log:
     # Container for active loggers
     active_loggers = []
 
+    # Queue of the asynchronous logging, None if loggers write directly
+    log_queue: LogQueue = None
+
+    # Lowest level printed by any active logger or captured by the ring buffer,
+    # messages below it are discarded with single comparison.
+    # Everything passes until the loggers are configured
+    min_level: int = logging.NOTSET
+
+    # Lowest level printed by any active logger
+    output_level: int = logging.NOTSET
+
+    # Recent messages kept in memory for dumps, None if the buffer is disabled
+    ring_buffer: LogRingBuffer = None
+
+    # Rate limits and sampling of call sites, see _throttled
+    throttle = LogThrottle(
+        lambda level, key, suppressed: _report_suppressed(
+            Log.active_loggers, level, key, suppressed))
+
     @staticmethod
     def config_init() -> None:
         """
@@ -178,6 +292,65 @@ class Log:
             )
             Log.active_loggers.append(logger_instance)
 
+        # Keeps recent messages of all outputs in memory, including levels no output prints
+        if config.log_buffer_size:
+            Log.ring_buffer = LogRingBuffer(
+                size=config.log_buffer_size,
+                level=config.log_buffer_level
+            )
+
+        Log.output_level = _min_level(Log.active_loggers)
+        Log.min_level = _capture_level(Log.output_level, Log.ring_buffer)
+
+        # Moves writing of messages to background thread
+        if config.log_async:
+            Log.log_queue = LogQueue(
+                max_size=config.log_queue_size,
+                block=config.log_queue_policy == configuration.LogQueuePolicy.BLOCK.value
+            )
+
+            for logger_instance in Log.active_loggers:
+                Log.log_queue.attach(logger_instance)
+
+            Log.log_queue.start()
+            atexit.register(Log.shutdown)
+
+    @staticmethod
+    def enabled_for(level: int) -> bool:
+        """
+        Checks whether message of given level would be printed or captured,
+        used to skip building expensive log arguments.
+        Messages take %-style arguments which are merged only when the message is printed
+
+        Args:
+            level (int): logging level
+
+        Returns:
+            bool: True if some active logger prints messages of the level
+                  or the ring buffer keeps them
+        """
+        return level >= Log.min_level
+
+    @staticmethod
+    def shutdown() -> None:
+        """
+        Reports messages suppressed by rate limits, writes all queued messages,
+        switches loggers back to writing directly and waits for compression of rotated files
+        """
+        Log.throttle.report_pending()
+
+        if Log.log_queue is not None:
+            log_queue: LogQueue = Log.log_queue
+            Log.log_queue = None
+            log_queue.stop()
+
+            if log_queue.dropped:
+                Log.warning(
+                    'Dropped %s log messages because the queue was full', log_queue.dropped)
+
+        # Rotated files are compressed before exit, so no pending file is left behind
+        close_compressor()
+
     @staticmethod
     def get_exclusive_console(name, *, level=logging.INFO) -> logging.Logger:
         """
@@ -235,6 +408,18 @@ class Log:
         """
         Prints debug message through all active loggers
         """
+        if logging.DEBUG < Log.min_level:
+            return
+
+        if kwargs and _throttled(Log.throttle, logging.DEBUG, args, kwargs):
+            return
+
+        if Log.ring_buffer is not None:
+            Log.ring_buffer.record(logging.DEBUG, 'BOT', args, kwargs)
+
+        if logging.DEBUG < Log.output_level:
+            return
+
         # Assert that there are some active loggers
         assert Log.active_loggers
 
@@ -246,6 +431,17 @@ class Log:
         """
         Prints info message through all active loggers
         """
+        if logging.INFO < Log.min_level:
+            return
+
+        if kwargs and _throttled(Log.throttle, logging.INFO, args, kwargs):
+            return
+
+        if Log.ring_buffer is not None:
+            Log.ring_buffer.record(logging.INFO, 'BOT', args, kwargs)
+
+        if logging.INFO < Log.output_level:
+            return
 
         # Assert that there are some active loggers
         assert Log.active_loggers
@@ -258,6 +454,17 @@ class Log:
         """
         Prints warning message through all active loggers
         """
+        if logging.WARNING < Log.min_level:
+            return
+
+        if kwargs and _throttled(Log.throttle, logging.WARNING, args, kwargs):
+            return
+
+        if Log.ring_buffer is not None:
+            Log.ring_buffer.record(logging.WARNING, 'BOT', args, kwargs)
+
+        if logging.WARNING < Log.output_level:
+            return
 
         # Assert that there are some active loggers
         assert Log.active_loggers
@@ -270,6 +477,17 @@ class Log:
         """
         Prints error message through all active loggers
         """
+        if logging.ERROR < Log.min_level:
+            return
+
+        if kwargs and _throttled(Log.throttle, logging.ERROR, args, kwargs):
+            return
+
+        if Log.ring_buffer is not None:
+            Log.ring_buffer.record(logging.ERROR, 'BOT', args, kwargs)
+
+        if logging.ERROR < Log.output_level:
+            return
 
         # Assert that there are some active loggers
         assert Log.active_loggers
@@ -282,6 +500,18 @@ class Log:
         """
         Prints critical message through all active loggers
         """
+        if logging.CRITICAL < Log.min_level:
+            return
+
+        if kwargs and _throttled(Log.throttle, logging.CRITICAL, args, kwargs):
+            return
+
+        if Log.ring_buffer is not None:
+            Log.ring_buffer.record(logging.CRITICAL, 'BOT', args, kwargs)
+
+        if logging.CRITICAL < Log.output_level:
+            return
+
         # Assert that there are some active loggers
         assert Log.active_loggers
 
@@ -289,6 +519,94 @@ class Log:
             logger.critical(*args, **kwargs)
 
 
+def _min_level(loggers: list) -> int:
+    """
+    Returns the lowest level printed by any of the loggers
+
+    Args:
+        loggers (list): list of logging.Logger
+
+    Returns:
+        int: logging level, above CRITICAL if there are no loggers
+    """
+    return min(
+        (logger.getEffectiveLevel() for logger in loggers), default=logging.CRITICAL + 1)
+
+
+def _capture_level(output_level: int, ring_buffer: LogRingBuffer) -> int:
+    """
+    Returns the lowest level that is either printed or captured by the ring buffer
+
+    Args:
+        output_level (int): lowest level printed by the loggers
+        ring_buffer (LogRingBuffer): ring buffer, None if disabled
+
+    Returns:
+        int: logging level
+    """
+    if ring_buffer is None:
+        return output_level
+
+    return min(output_level, ring_buffer.level)
+
+
+def _throttled(throttle: LogThrottle, level: int, args: tuple, kwargs: dict) -> bool:
+    """
+    Applies rate limit and sampling requested by the call site.
+    Message passes keyword arguments, which are removed from kwargs:
+        rate (float): maximal number of messages per second, below 1 for one message per 1/rate s
+        sample (int): print only every n-th message
+        throttle_key (str): call site key, defaults to the message format string
+    When the message passes after some were suppressed by the rate limit, summary is printed first.
+    Call sites that stay quiet after a burst are summarized by the throttle in the background
+
+    Args:
+        throttle (LogThrottle): throttle state of the loggers
+        level (int): logging level of the message
+        args (tuple): message arguments
+        kwargs (dict): message keyword arguments
+
+    Raises:
+        ValueError: Raised if rate is not positive or sample is lower than 1
+
+    Returns:
+        bool: True if the message should be discarded
+    """
+    rate: float = kwargs.pop('rate', None)
+    sample: int = kwargs.pop('sample', None)
+    key: str = kwargs.pop('throttle_key', None)
+
+    if rate is None and sample is None:
+        return False
+
+    if key is None:
+        key = str(args[0]) if args else ''
+
+    suppressed: int = throttle.check(key, level, rate=rate, sample=sample)
+
+    if suppressed < 0:
+        return True
+
+    if suppressed:
+        throttle.report(level, key, suppressed)
+
+    return False
+
+
+def _report_suppressed(loggers: list, level: int, key: str, suppressed: int) -> None:
+    """
+    Prints summary of messages suppressed by the rate limit
+
+    Args:
+        loggers (list): loggers printing the summary
+        level (int): logging level of the suppressed messages
+        key (str): call site key
+        suppressed (int): number of suppressed messages
+    """
+    for logger in loggers:
+        logger.log(level, 'Suppressed %s similar messages: %s', suppressed, key)
+
+
 def _init_console(*, name: str, level: int, use_color: bool) -> None:
 
     # Retrive console logger
@@ -326,11 +644,13 @@ def _init_console(*, name: str, level: int, use_color: bool) -> None:
 def _init_file(*, name: str, level: int) -> None:
     """
     Activates and configures the file logger.
+    Rotation, compression, retention and format are taken from app configuration.
     For internal use only
 
     Args:
         level (int): Logging level
     """
+    config = configuration.get_config()
 
     # Try to make a Logs directory if one does not exist
     try:
@@ -344,14 +664,23 @@ def _init_file(*, name: str, level: int) -> None:
     file_name: str = name.lower() + '-log'
 
     # Handler
-    handler = logging.FileHandler(f'Logs/{file_name}.log')
+    handler = create_file_handler(
+        f'Logs/{file_name}.log',
+        rotation=configuration.LogRotation(config.file_rotation),
+        max_size=config.file_max_size,
+        backup_count=config.file_backup_count,
+        compress=config.file_compress
+    )
     handler.setLevel(level)
 
     # Formatter
-    formatter: logging.Formatter = logging.Formatter(
-        fmt=logging_format,
-        datefmt=datefmt
-    )
+    if config.file_format == configuration.LogFileFormat.JSON.value:
+        formatter: logging.Formatter = JsonLinesFormatter()
+    else:
+        formatter = logging.Formatter(
+            fmt=logging_format,
+            datefmt=datefmt
+        )
 
     handler.setFormatter(formatter)
     logging_instance.addHandler(handler)
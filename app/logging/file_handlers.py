@@ -0,0 +1,226 @@
+"""
+File logging with bounded disk usage. Log files are rotated by size or daily,
+rotated files are compressed with gzip by background thread and only a limited number is kept.
+Records can be written as JSON lines with stable fields for log ingestion
+"""
+
+# Library includes
+import atexit
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler, TimedRotatingFileHandler
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+
+# App includes
+from app.configuration import LogRotation
+
+
+# Fields read from record attributes set through extra={...}, null when missing
+STRUCTURED_FIELDS: tuple = ('guild_id', 'command', 'latency')
+
+# Suffix of rotated files waiting for compression, they hold log data
+PENDING_SUFFIX: str = '.pending'
+
+# Suffix of partially compressed files, they can always be removed
+PARTIAL_SUFFIX: str = '.part'
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats every record as single JSON object with stable set of fields
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'process': record.process,
+            'message': record.getMessage(),
+        }
+
+        for field in STRUCTURED_FIELDS:
+            entry[field] = getattr(record, field, None)
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _Compressor:
+    """
+    Single background thread compressing rotated log files in the order they were rotated
+    """
+
+    def __init__(self) -> None:
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, source: str, dest: str) -> None:
+        """
+        Schedules compression of source file to dest, source is removed afterwards
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='log-compressor', daemon=True)
+                self._thread.start()
+
+                # Daemon thread is killed at exit, queued files are compressed before
+                atexit.register(self.close)
+
+        self._queue.put((source, dest))
+
+    def close(self) -> None:
+        """
+        Waits until every queued file is compressed
+        """
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            source, dest = self._queue.get()
+
+            # Compressed to unique name first, so dest never holds partial file
+            partial: str = f'{dest}.{time.time_ns()}{PARTIAL_SUFFIX}'
+
+            try:
+                with open(source, 'rb') as source_file, gzip.open(partial, 'wb') as dest_file:
+                    shutil.copyfileobj(source_file, dest_file)
+                os.replace(partial, dest)
+                os.remove(source)
+            except Exception as exc:  # pylint: disable=broad-except
+                # Logging from here could rotate again, report straight to stderr.
+                # The source is kept and compressed again at the next start
+                sys.stderr.write(f'Could not compress log file {source}: {exc}\n')
+                _remove_file(partial)
+            finally:
+                self._queue.task_done()
+
+
+_compressor = _Compressor()
+
+
+def close_compressor() -> None:
+    """
+    Waits until rotated log files queued for compression are compressed
+    """
+    _compressor.close()
+
+
+class _CompressingRotatingFileHandler(RotatingFileHandler):
+    """
+    Size rotating handler that finishes compression of the previous file before
+    backups are renamed, so the compressed file lands under its current name
+    """
+
+    def doRollover(self) -> None:
+        _compressor.close()
+        super().doRollover()
+
+
+class _CompressingTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """
+    Daily rotating handler that finishes compression of the previous file before
+    old backups are deleted, so retention sees every compressed file
+    """
+
+    def doRollover(self) -> None:
+        _compressor.close()
+        super().doRollover()
+
+
+def _gzip_namer(name: str) -> str:
+    return name + '.gz'
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    # Only quick rename happens on the logging thread, compression runs in the background
+    pending: str = f'{dest}.{time.time_ns()}{PENDING_SUFFIX}'
+    os.rename(source, pending)
+    _compressor.submit(pending, dest)
+
+
+def _recover_stale_files(path: str) -> None:
+    """
+    Cleans up after compression interrupted by crash. Partially compressed files are removed,
+    rotated files that were not compressed yet are queued for compression again
+
+    Args:
+        path (str): path to the log file
+    """
+    directory: str = os.path.dirname(path) or '.'
+    prefix: str = os.path.basename(path) + '.'
+
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith(prefix):
+            continue
+
+        file_path: str = os.path.join(directory, name)
+
+        if name.endswith(PARTIAL_SUFFIX):
+            _remove_file(file_path)
+        elif name.endswith(PENDING_SUFFIX):
+            # Name is {dest}.{time_ns}.pending
+            dest: str = file_path[:-len(PENDING_SUFFIX)].rsplit('.', 1)[0]
+
+            # Slot taken by newer backup, the file is kept rather than lost
+            if os.path.exists(dest):
+                sys.stderr.write(f'Log file {file_path} was not compressed, {dest} exists\n')
+                continue
+
+            _compressor.submit(file_path, dest)
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def create_file_handler(path: str, *, rotation: LogRotation, max_size: int, backup_count: int,
+                        compress: bool) -> logging.Handler:
+    """
+    Creates handler writing to the file with given rotation
+
+    Args:
+        path (str): path to the log file
+        rotation (LogRotation): when the file is rotated
+        max_size (int): size in bytes after which SIZE rotation happens
+        backup_count (int): number of kept rotated files
+        compress (bool): True to compress rotated files with gzip
+
+    Returns:
+        logging.Handler: file handler
+    """
+    if rotation == LogRotation.NONE:
+        return logging.FileHandler(path, encoding='utf-8')
+
+    if compress:
+        _recover_stale_files(path)
+
+    if rotation == LogRotation.SIZE:
+        handler_class: type = _CompressingRotatingFileHandler if compress else RotatingFileHandler
+        handler: logging.FileHandler = handler_class(
+            path, maxBytes=max_size, backupCount=backup_count, encoding='utf-8')
+    else:
+        handler_class = (_CompressingTimedRotatingFileHandler if compress
+                         else TimedRotatingFileHandler)
+        handler = handler_class(
+            path, when='midnight', backupCount=backup_count, encoding='utf-8')
+
+    if compress:
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+
+    return handler
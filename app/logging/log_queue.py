@@ -0,0 +1,141 @@
+"""
+Asynchronous logging pipeline. Loggers only put records to a bounded queue,
+the real handlers are owned by single background thread, so slow console or disk
+never stalls the thread that logs
+"""
+
+# Library includes
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List
+import logging
+import queue
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Queue handler of single logger that either drops records or blocks when the queue is full.
+    Queued records are tagged with the logger name so they reach only its handlers
+
+    Args:
+        log_queue (LogQueue): owner of the queue
+        route (str): name of the logger the handler is attached to
+    """
+
+    def __init__(self, log_queue: 'LogQueue', route: str) -> None:
+        super().__init__(log_queue.queue)
+        self.log_queue: LogQueue = log_queue
+        self.route: str = route
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        record.log_route = self.route
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.log_queue.block:
+            self.queue.put(record)
+            return
+
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.log_queue.dropped += 1
+
+
+class _RoutingListener(QueueListener):
+    """
+    Queue listener passing every record only to handlers of the logger that queued it
+    """
+
+    def __init__(self, record_queue: queue.Queue, routes: Dict[str, List[logging.Handler]]) -> None:
+        super().__init__(record_queue, respect_handler_level=True)
+        self.routes: Dict[str, List[logging.Handler]] = routes
+
+    def enqueue_sentinel(self) -> None:
+        # Full queue must not prevent the thread from stopping
+        self.queue.put(self._sentinel)
+
+    def handle(self, record: logging.LogRecord) -> None:
+        for handler in self.routes.get(getattr(record, 'log_route', record.name), ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class LogQueue:
+    """
+    Moves handlers of attached loggers behind single bounded queue served by background thread
+
+    Args:
+        max_size (int): maximal number of queued records
+        block (bool): True to wait when the queue is full, False to drop new records
+    """
+
+    def __init__(self, *, max_size: int, block: bool) -> None:
+        self.queue: queue.Queue = queue.Queue(max_size)
+        self.block: bool = block
+
+        # Number of records dropped because the queue was full
+        self.dropped: int = 0
+
+        # logger name -> handlers owned by the listener
+        self._routes: Dict[str, List[logging.Handler]] = {}
+
+        # logger name -> queue handler attached to the logger
+        self._queue_handlers: Dict[str, BoundedQueueHandler] = {}
+
+        self._listener = _RoutingListener(self.queue, self._routes)
+        self._running: bool = False
+
+    def attach(self, logger: logging.Logger) -> None:
+        """
+        Hands handlers of the logger over to the background thread
+
+        Args:
+            logger (logging.Logger): configured logger
+        """
+        queue_handler: BoundedQueueHandler = self._queue_handlers.get(logger.name)
+
+        if queue_handler is None:
+            queue_handler = BoundedQueueHandler(self, logger.name)
+            self._queue_handlers[logger.name] = queue_handler
+
+        handlers: List[logging.Handler] = [
+            handler for handler in logger.handlers if handler is not queue_handler]
+
+        for handler in handlers:
+            logger.removeHandler(handler)
+
+        self._routes.setdefault(logger.name, []).extend(handlers)
+
+        if queue_handler not in logger.handlers:
+            logger.addHandler(queue_handler)
+
+    def start(self) -> None:
+        """
+        Starts the background thread
+        """
+        if not self._running:
+            self._listener.start()
+            self._running = True
+
+    def stop(self) -> None:
+        """
+        Writes every queued record and gives the handlers back to their loggers,
+        so records logged later are written directly
+        """
+        if not self._running:
+            return
+
+        self._listener.stop()
+        self._running = False
+
+        for name, handlers in self._routes.items():
+            logger: logging.Logger = logging.getLogger(name)
+            logger.removeHandler(self._queue_handlers[name])
+
+            for handler in handlers:
+                logger.addHandler(handler)
+                handler.flush()
+
+        self._routes.clear()
+        self._queue_handlers.clear()
@@ -0,0 +1,187 @@
+"""
+Fixed-size in-memory capture of recent log messages. Messages are kept as compact tuples
+of their format string and snapshots of the arguments, merged only when the buffer is dumped
+"""
+
+# Library includes
+from collections import deque
+from datetime import datetime
+from typing import Iterator, List, Mapping, NamedTuple
+import logging
+import sys
+import time
+import traceback
+
+
+# Arguments kept as they are, everything else is stored as text
+_SCALAR_TYPES: tuple = (str, int, float, bool, type(None))
+
+# Maximal length of argument text, longer ones are cut
+MAX_ARGUMENT_LENGTH: int = 1000
+
+
+class BufferedRecord(NamedTuple):
+    """
+    Captured log message
+    """
+    created: float
+    level: int
+    logger: str
+    msg: str
+    args: tuple
+    guild_id: int
+    exception: str
+
+    def message(self) -> str:
+        """
+        Merges the message with its arguments
+
+        Returns:
+            str: message text
+        """
+        if not self.args:
+            return str(self.msg)
+
+        arguments: object = self.args
+        if len(arguments) == 1 and isinstance(arguments[0], Mapping):
+            arguments = arguments[0]
+
+        try:
+            return str(self.msg) % arguments
+        except (TypeError, ValueError):
+            return f'{self.msg} {self.args}'
+
+    def format(self) -> str:
+        """
+        Formats the record as single log line, followed by the exception if there was one
+
+        Returns:
+            str: formatted record
+        """
+        created: str = datetime.fromtimestamp(self.created).strftime('%Y-%m-%d %H:%M:%S.%f')
+        guild: str = f' guild:{self.guild_id}' if self.guild_id is not None else ''
+
+        line: str = (f'{created} | {self.logger} {logging.getLevelName(self.level)}'
+                     f'{guild}: {self.message()}')
+
+        return f'{line}\n{self.exception}' if self.exception else line
+
+
+class LogRingBuffer:
+    """
+    Keeps the last size messages of at least given level, older ones are discarded
+
+    Args:
+        size (int): number of kept messages
+        level (int): lowest captured level
+    """
+
+    def __init__(self, *, size: int, level: int) -> None:
+        self.size: int = size
+        self.level: int = level
+
+        # Appending to deque is atomic, so messages logged from executor threads are safe
+        self._records: deque = deque(maxlen=size)
+
+    def record(self, level: int, logger: str, args: tuple, kwargs: dict) -> None:
+        """
+        Captures the message with arguments of Log.debug() etc.
+
+        Args:
+            level (int): logging level
+            logger (str): name of the logger
+            args (tuple): message and its arguments
+            kwargs (dict): keyword arguments of the logging call
+        """
+        if level < self.level or not args:
+            return
+
+        extra: dict = kwargs.get('extra') or {}
+        arguments: tuple = args[1:]
+
+        # Single mapping argument is used for %(name)s formatting, like in logging
+        if len(arguments) == 1 and isinstance(arguments[0], Mapping):
+            arguments = ({key: _snapshot(value) for key, value in arguments[0].items()},)
+        else:
+            arguments = tuple(_snapshot(argument) for argument in arguments)
+
+        self._records.append(BufferedRecord(
+            time.time(), level, logger, _snapshot(args[0]), arguments,
+            extra.get('guild_id'), _format_exception(kwargs.get('exc_info'))
+        ))
+
+    def records(self, *, guild_id: int = None, logger: str = None) -> List[BufferedRecord]:
+        """
+        Returns captured messages from the oldest one
+
+        Args:
+            guild_id (int, optional): only messages tagged with the guild or having
+                                      its id as an argument. Defaults to all messages.
+            logger (str, optional): only messages of the logger, case insensitive.
+                                    Defaults to all loggers.
+
+        Returns:
+            List[BufferedRecord]: matching records
+        """
+        records: Iterator[BufferedRecord] = iter(tuple(self._records))
+
+        if logger is not None:
+            logger = logger.lower()
+            records = (record for record in records if record.logger.lower() == logger)
+
+        if guild_id is not None:
+            records = (record for record in records
+                       if record.guild_id == guild_id or guild_id in record.args)
+
+        return list(records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+def _snapshot(value: object) -> object:
+    """
+    Returns value that does not change and does not keep the logged object alive
+
+    Args:
+        value (object): logged argument
+
+    Returns:
+        object: scalar value as is, text of any other value
+    """
+    if isinstance(value, _SCALAR_TYPES):
+        if isinstance(value, str) and len(value) > MAX_ARGUMENT_LENGTH:
+            return value[:MAX_ARGUMENT_LENGTH] + '\u2026'
+        return value
+
+    try:
+        text: str = str(value)
+    except Exception:  # pylint: disable=broad-except
+        text = f'<unprintable {type(value).__name__}>'
+
+    return text if len(text) <= MAX_ARGUMENT_LENGTH else text[:MAX_ARGUMENT_LENGTH] + '\u2026'
+
+
+def _format_exception(exc_info: object) -> str:
+    """
+    Formats exception passed as exc_info the same way as logging does.
+    Exceptions are formatted right away, they reference whole stack frames
+
+    Args:
+        exc_info (object): True for the handled exception, exception instance or exc_info tuple
+
+    Returns:
+        str: formatted traceback, None if there is no exception
+    """
+    if not exc_info:
+        return None
+
+    if isinstance(exc_info, BaseException):
+        exc_info = (type(exc_info), exc_info, exc_info.__traceback__)
+    elif not isinstance(exc_info, tuple):
+        exc_info = sys.exc_info()
+
+    if exc_info[0] is None:
+        return None
+
+    return ''.join(traceback.format_exception(*exc_info)).rstrip()
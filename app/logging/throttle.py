@@ -0,0 +1,147 @@
+"""
+Rate limiting and sampling of frequent log messages. Every call site is identified by a key,
+by default the message format string, and keeps its own limits, so a flood of one message
+does not hide the others. Messages suppressed by the rate limit are counted and reported
+as a single summary line, either once the call site is allowed to log again
+or by background thread after the burst
+"""
+
+# Library includes
+from typing import Callable, Dict, List, Tuple
+import threading
+import time
+
+# App includes
+from app.rate_limit import TokenBucket
+
+
+# Maximal number of tracked call sites, the oldest one is forgotten when exceeded
+MAX_THROTTLE_KEYS: int = 10000
+
+# Seconds after which suppressed messages are reported even if the call site stays quiet
+SUMMARY_INTERVAL: float = 60.0
+
+
+class _CallSite:
+    """
+    Limits and counters of single call site
+    """
+    __slots__ = ('bucket', 'level', 'calls', 'suppressed')
+
+    def __init__(self, level: int, rate: float) -> None:
+        # Single message must fit into the bucket, rates below 1 mean one message per 1/rate s
+        self.bucket: TokenBucket = None if rate is None else TokenBucket(
+            rate, capacity=max(1.0, rate))
+        self.level: int = level
+        self.calls: int = 0
+        self.suppressed: int = 0
+
+
+class LogThrottle:
+    """
+    Decides which messages of throttled call sites are printed.
+    Safe to use from executor threads
+
+    Args:
+        report (Callable): called with (level, key, suppressed messages) to print summary
+        max_keys (int, optional): maximal number of tracked call sites.
+                                  Defaults to MAX_THROTTLE_KEYS.
+        summary_interval (float, optional): seconds between background summaries.
+                                            Defaults to SUMMARY_INTERVAL.
+    """
+
+    def __init__(self, report: Callable[[int, str, int], None], *,
+                 max_keys: int = MAX_THROTTLE_KEYS,
+                 summary_interval: float = SUMMARY_INTERVAL) -> None:
+        self.report: Callable[[int, str, int], None] = report
+        self.max_keys: int = max_keys
+        self.summary_interval: float = summary_interval
+
+        # key -> call site state, in insertion order
+        self._sites: Dict[str, _CallSite] = {}
+        self._lock = threading.Lock()
+
+        # Reports summaries of quiet call sites, started with the first suppressed message
+        self._reporter: threading.Thread = None
+
+    def check(self, key: str, level: int, *, rate: float = None, sample: int = None) -> int:
+        """
+        Registers call of the call site
+
+        Args:
+            key (str): call site key
+            level (int): logging level of the message
+            rate (float, optional): maximal number of messages per second. Defaults to no limit.
+            sample (int, optional): print only every n-th message. Defaults to all messages.
+
+        Raises:
+            ValueError: Raised if rate is not positive or sample is lower than 1
+
+        Returns:
+            int: -1 if the message should be discarded, otherwise number of messages
+                 suppressed by the rate limit since the last printed one
+        """
+        if rate is not None and rate <= 0:
+            raise ValueError(f'Log rate must be positive, got {rate}')
+
+        if sample is not None and sample < 1:
+            raise ValueError(f'Log sample must be at least 1, got {sample}')
+
+        with self._lock:
+            site: _CallSite = self._sites.get(key)
+
+            if site is None:
+                if len(self._sites) >= self.max_keys:
+                    del self._sites[next(iter(self._sites))]
+
+                site = _CallSite(level, rate)
+                self._sites[key] = site
+
+            site.calls += 1
+
+            # Sampling is expected to skip messages, so skipped ones are not reported
+            if sample is not None and (site.calls - 1) % sample:
+                return -1
+
+            if site.bucket is not None and not site.bucket.try_acquire():
+                site.suppressed += 1
+
+                if self._reporter is None:
+                    self._reporter = threading.Thread(
+                        target=self._report_periodically, name='log-throttle', daemon=True)
+                    self._reporter.start()
+
+                return -1
+
+            suppressed: int = site.suppressed
+            site.suppressed = 0
+            return suppressed
+
+    def drain(self) -> List[Tuple[int, str, int]]:
+        """
+        Returns and resets counts of messages suppressed since the last printed one
+
+        Returns:
+            List[Tuple[int, str, int]]: list of (level, key, suppressed messages)
+        """
+        with self._lock:
+            pending: List[Tuple[int, str, int]] = [
+                (site.level, key, site.suppressed)
+                for key, site in self._sites.items() if site.suppressed]
+
+            for site in self._sites.values():
+                site.suppressed = 0
+
+        return pending
+
+    def report_pending(self) -> None:
+        """
+        Prints summaries of all suppressed messages
+        """
+        for level, key, suppressed in self.drain():
+            self.report(level, key, suppressed)
+
+    def _report_periodically(self) -> None:
+        while True:
+            time.sleep(self.summary_interval)
+            self.report_pending()
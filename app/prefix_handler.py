@@ -2,10 +2,20 @@
 This module handles complications of dynamic retrieving prefixes for different servers
 It requests server prefix from database and caches it for optimization
 
+Retrieving prefixes never blocks the event loop. When the prefix is not cached (or the cached
+value is stale) the last known value, or the default empty prefix, is returned immediately
+and the prefix is retrieved from firestore in the background
+
+Optionally the cache can be kept up to date by firestore snapshot listener which pushes
+changes of server configurations made by other bot processes or through the console
+
 """
 
 # Library includes
+import asyncio
+
 from firebase_admin import firestore
+from google.api_core.exceptions import GoogleAPIError
 
 
 # Library imports for typing hints
@@ -14,74 +24,498 @@ from google.cloud.firestore import DocumentReference
 
 # App includes
 from app.logging.core import Log
+from app.cache import TTLCache
+from app.single_flight import SingleFlight
+from app.write_behind import write_queue
+
+
+# Maximal number of cached server prefixes
+PREFIX_CACHE_SIZE: int = 10000
+
+# Time in seconds after which cached prefix is refreshed in the background
+PREFIX_TTL: float = 300.0
+
+# Time in seconds after which prefix of server without firestore entry is refreshed
+PREFIX_NEGATIVE_TTL: float = 60.0
+
+# Time in seconds during which server is not retried after failed retrieval
+PREFIX_ERROR_TTL: float = 30.0
+
+# Time in seconds after which prefixes are revalidated while live updates are active,
+# safety net for updates the watch did not deliver
+PREFIX_LIVE_TTL: float = 3600.0
+
+# Seconds between checks whether the firestore watch is still active
+WATCH_CHECK_INTERVAL: float = 60.0
+
+# Maximal number of server configurations retrieved by single batched read
+PREFETCH_CHUNK_SIZE: int = 100
+
+# Prefix used in servers without custom prefix
+DEFAULT_PREFIX: str = '?'
 
+# Prefixes used in private messages
+PRIVATE_PREFIXES: tuple = ('!', '?')
 
 # Storage for prefixes
-server_prefixes = {}
+prefix_cache = TTLCache(
+    max_size=PREFIX_CACHE_SIZE,
+    ttl=PREFIX_TTL,
+    negative_ttl=PREFIX_NEGATIVE_TTL
+)
+
+# Background retrievals that are currently running, keyed by guild id
+_retrievals = SingleFlight()
+
+# Firestore watch pushing server configuration changes, None if live updates are inactive
+_config_watch = None
 
 
 def get_server_prefix(guild_id: int) -> str:
     """
-    Retrives sever prefix for given guild-id from firestore and caches it
+    Returns sever prefix for given guild-id without blocking the event loop.
+    If the prefix is missing or stale it is retrieved from firestore in the background
+    and the last known prefix (or empty prefix if there is none) is returned
 
     Returns:
         str: server prefix
     """
+    prefix: str = prefix_cache.get(guild_id)
+
     # If prefix is arleady cached
-    if guild_id in server_prefixes:
-        Log.debug(f'Using cached prefix for server {guild_id}')
-        return server_prefixes[guild_id]
+    if prefix is not None:
+        # Hit on every message, only few per second are printed
+        Log.debug('Using cached prefix for server %s', guild_id, rate=5)
+        return prefix
 
-    #################################
+    # Revalidate missing or stale prefix in the background
+    _retrievals.start(guild_id, _retrieve_server_prefix, guild_id)
+    return prefix_cache.peek(guild_id, '')
+
+
+async def resolve_server_prefix(guild_id: int) -> str:
+    """
+    Coroutine that returns up to date server prefix, waiting for the firestore
+    retrieval if the prefix is not cached
+
+    Args:
+        guild_id (int): guild id
+
+    Returns:
+        str: server prefix
+    """
+    if guild_id in prefix_cache:
+        return get_server_prefix(guild_id)
+
+    task: asyncio.Future = _retrievals.start(
+        guild_id, _retrieve_server_prefix, guild_id)
+
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        # Retrieval was dropped because the prefix was updated in the meantime
+        if task.cancelled():
+            return prefix_cache.peek(guild_id, '')
+        raise
+
+
+async def prefetch_server_prefixes(guild_ids) -> None:
+    """
+    Warms up the prefix cache for given servers using batched reads.
+    Servers which prefixes are already cached are skipped
+
+    Args:
+        guild_ids (Iterable[int]): ids of guilds which prefixes will be retrieved
+    """
+    # Also with live updates active, the watch only refreshes servers that are cached
+    missing_ids: list = [
+        guild_id for guild_id in guild_ids if guild_id not in prefix_cache]
+
+    # Prefetching more servers than the cache can hold would only evict them again
+    del missing_ids[prefix_cache.max_size:]
+
+    if not missing_ids:
+        return
+
+    Log.info('Prefetching prefixes for %s servers', len(missing_ids))
+    loop = asyncio.get_event_loop()
+
+    for start in range(0, len(missing_ids), PREFETCH_CHUNK_SIZE):
+        chunk: list = missing_ids[start:start + PREFETCH_CHUNK_SIZE]
+
+        try:
+            prefixes: dict = await loop.run_in_executor(None, _read_server_prefixes, chunk)
+        except GoogleAPIError as exc:
+            Log.error('Could not prefetch server prefixes: %s', exc)
+            return
+
+        for guild_id in chunk:
+            # Prefix could have been changed while the chunk was retrieved
+            if guild_id in prefix_cache:
+                continue
+
+            prefix: str = prefixes.get(guild_id)
+
+            if prefix is None:
+                prefix_cache.set(guild_id, '', negative=True)
+            else:
+                prefix_cache.set(guild_id, prefix)
+
+    Log.info('Finished prefetching server prefixes')
+
+
+async def _retrieve_server_prefix(guild_id: int) -> str:
+    """
+    Retrieves server prefix in the executor and stores it in cache
 
-    Log.debug(f'Retriving prefix from firestore for server {guild_id}')
+    Args:
+        guild_id (int): guild id
+
+    Returns:
+        str: server prefix
+    """
+    loop = asyncio.get_event_loop()
+
+    try:
+        prefix: str = await loop.run_in_executor(None, _read_server_prefix, guild_id)
+    except GoogleAPIError as exc:
+        Log.error('Could not retrive prefix for server %s: %s', guild_id, exc)
+        return _serve_last_prefix(guild_id)
+    except Exception:  # pylint: disable=broad-except
+        Log.error('Could not retrive prefix for server %s', guild_id, exc_info=True)
+        return _serve_last_prefix(guild_id)
+
+    # Server without firestore entry is cached as negative entry
+    if prefix is None:
+        Log.debug(
+            'Firestore entry does noe exist for guild %s, creating entry', guild_id)
+        write_queue.create(_server_config_path(guild_id), {'prefix': ''})
+        prefix_cache.set(guild_id, '', negative=True)
+        return ''
+
+    prefix_cache.set(guild_id, prefix)
+    return prefix
+
+
+def _serve_last_prefix(guild_id: int) -> str:
+    """
+    Returns prefix used after failed read. Last known prefix is served as negative entry,
+    so next messages do not retry at once
+
+    Args:
+        guild_id (int): guild id
+
+    Returns:
+        str: last known server prefix, empty if there is none
+    """
+    last_prefix: str = prefix_cache.peek(guild_id, '')
+    prefix_cache.set(guild_id, last_prefix, negative=True, ttl=PREFIX_ERROR_TTL)
+    return last_prefix
+
+
+def _read_server_prefix(guild_id: int) -> str:
+    """
+    Reads server prefix from firestore. This call is blocking and should be run in executor
+
+    Args:
+        guild_id (int): guild id
+
+    Returns:
+        str: server prefix, None if server did not have firestore entry
+    """
+    Log.debug('Retriving prefix from firestore for server %s', guild_id)
     # Retrive firestore client
     db_client: FirestoreClient = firestore.client()
 
-    # Path to the document holding server configuration
-    path_to_server_config: str = f'bot-root/{guild_id}/server-specific/server-config'
-
     # Get document reference
     doc_reference: DocumentReference = db_client.document(
-        path_to_server_config)
+        _server_config_path(guild_id))
 
     # Retrive server configuration
     server_configuration: dict = doc_reference.get().to_dict()
 
     # Check if server configuration exists
     if server_configuration is None:
-        Log.debug(
-            f'Firestore entry does noe exist for guild {guild_id}, creating entry')
-        server_prefixes[guild_id] = ''
-        doc_reference.set({'prefix': ''})  # Sets document with
-        return ''
+        return None
 
-    prefix = server_configuration.get('prefix', '')
-    server_prefixes[guild_id] = prefix
-    return prefix
+    return server_configuration.get('prefix', '')
+
+
+def _read_server_prefixes(guild_ids: list) -> dict:
+    """
+    Reads prefixes of multiple servers with single batched read.
+    This call is blocking and should be run in executor
+
+    Args:
+        guild_ids (list): guild ids
+
+    Returns:
+        dict: guild id to server prefix, servers without firestore entry are omitted
+    """
+    Log.debug('Retriving prefixes from firestore for %s servers', len(guild_ids))
+    # Retrive firestore client
+    db_client: FirestoreClient = firestore.client()
+
+    # Document path to guild id
+    guild_paths: dict = {
+        _server_config_path(guild_id): guild_id for guild_id in guild_ids}
+
+    doc_references: list = [db_client.document(path) for path in guild_paths]
+
+    prefixes: dict = {}
+
+    for snapshot in db_client.get_all(doc_references):
+        if not snapshot.exists:
+            continue
+
+        guild_id: int = guild_paths[snapshot.reference.path]
+        prefixes[guild_id] = snapshot.to_dict().get('prefix', '')
+
+    return prefixes
+
+
+def _server_config_path(guild_id: int) -> str:
+    """
+    Returns path to the document holding server configuration
+
+    Args:
+        guild_id (int): guild id
+    """
+    return f'bot-root/{guild_id}/server-specific/server-config'
 
 
 def set_server_prefix(guild_id: int, prefix: str) -> None:
     """
-    Updates server prefix
+    Updates server prefix. The prefix is cached right away
+    while the firestore entry is written in the background
 
     Args:
         guild_id (int): guild id
         prefix (str): prefix to be set
     """
-    Log.info(f'Updating server({guild_id}) prefix to {prefix}')
+    Log.info('Updating server(%s) prefix to %s', guild_id, prefix)
+
+    # Drop retrieval that is in progress so it won't overwrite the new prefix
+    _retrievals.cancel(guild_id)
+
+    # Update cached prefix
+    prefix_cache.set(guild_id, prefix)
+
+    # Update value
+    write_queue.set(_server_config_path(guild_id), {'prefix': prefix})
+
+
+def evict_server_prefix(guild_id: int) -> None:
+    """
+    Removes server prefix from cache, used when bot leaves the server
+
+    Args:
+        guild_id (int): guild id
+    """
+    Log.debug('Evicting cached prefix for server %s', guild_id)
+
+    _retrievals.cancel(guild_id)
+
+    prefix_cache.evict(guild_id)
+    prefix_matcher.evict(guild_id)
+
+
+def start_prefix_listener() -> None:
+    """
+    Subscribes to changes of all server configurations in firestore.
+    Pushed changes are applied to the prefix cache which entries then expire only after
+    PREFIX_LIVE_TTL. When the watch stops, the regular expiration is restored.
+    Has to be called from the running event loop
+    """
+    global _config_watch
+
+    if _config_watch is not None:
+        return
+
+    Log.warning('Subscribing to server configuration changes')
+
+    loop = asyncio.get_event_loop()
+
+    def on_snapshot(_snapshots, changes, _read_time) -> None:
+        # Called from the firestore watch thread
+        updates: list = []
+
+        for change in changes:
+            document = change.document
+
+            if document.id != 'server-config':
+                continue
+
+            # Path is bot-root/{guild_id}/server-specific/server-config
+            try:
+                guild_id: int = int(document.reference.parent.parent.id)
+            except (AttributeError, TypeError, ValueError):
+                Log.warning('Ignoring server configuration at %s', document.reference.path)
+                continue
+
+            if change.type.name == 'REMOVED':
+                updates.append((guild_id, None))
+            else:
+                updates.append(
+                    (guild_id, (document.to_dict() or {}).get('prefix', '')))
+
+        loop.call_soon_threadsafe(_apply_prefix_updates, updates)
+
+    # Pushed values are kept up to date thus they are revalidated only rarely
+    prefix_cache.ttl = PREFIX_LIVE_TTL
+    prefix_cache.negative_ttl = PREFIX_LIVE_TTL
 
-    # Retrive Firestore Client
     db_client: FirestoreClient = firestore.client()
+    _config_watch = db_client.collection_group(
+        'server-specific').on_snapshot(on_snapshot)
 
-    # Path to server config
-    path_to_server_config: str = f'bot-root/{guild_id}/server-specific/server-config'
+    loop.call_later(WATCH_CHECK_INTERVAL, _check_prefix_listener)
 
-    # Update cached prefix
-    server_prefixes[guild_id] = prefix
 
-    # Retrive document pointer
-    doc_ref: DocumentReference = db_client.document(path_to_server_config)
+def _check_prefix_listener() -> None:
+    """
+    Restores prefix expiration if the firestore watch stopped after an error.
+    The watch does not report its failure, so it is checked periodically
+    """
+    if _config_watch is None:
+        return
 
-    # Update value
-    doc_ref.set({'prefix': prefix}, merge=True)
+    if getattr(_config_watch, 'is_active', True):
+        asyncio.get_event_loop().call_later(WATCH_CHECK_INTERVAL, _check_prefix_listener)
+        return
+
+    Log.error('Server configuration watch stopped, prefixes expire regularly again')
+    stop_prefix_listener()
+
+
+def stop_prefix_listener() -> None:
+    """
+    Unsubscribes from server configuration changes and restores prefix expiration
+    """
+    global _config_watch
+
+    if _config_watch is None:
+        return
+
+    Log.warning('Unsubscribing from server configuration changes')
+
+    _config_watch.unsubscribe()
+    _config_watch = None
+
+    prefix_cache.ttl = PREFIX_TTL
+    prefix_cache.negative_ttl = PREFIX_NEGATIVE_TTL
+
+
+def _apply_prefix_updates(updates: list) -> None:
+    """
+    Applies prefix changes pushed by snapshot listener
+
+    Args:
+        updates (list): list of (guild id, prefix) pairs, prefix is None if entry was removed
+    """
+    Log.debug('Applying %s pushed prefix updates', len(updates))
+
+    for guild_id, prefix in updates:
+        # The watch reports every server, only servers the bot uses are cached
+        if prefix_cache.peek(guild_id) is None:
+            continue
+
+        # Pushed value is newer than anything retrieval in flight could return
+        _retrievals.cancel(guild_id)
+
+        if prefix is None:
+            prefix_cache.set(guild_id, '', negative=True)
+        else:
+            prefix_cache.set(guild_id, prefix)
+
+
+class PrefixMatcher:
+    """
+    Holds precomputed immutable prefix tuples for private messages and for every server.
+    Server tuple is rebuilt only when its prefix or the bot user changes.
+    Every tuple starts with the two bot mention prefixes followed by the custom prefixes
+    """
+
+    def __init__(self) -> None:
+        self.user_id: int = None
+        self._mention_prefixes: tuple = ()
+
+        # (None, prefixes, first characters of prefixes) used for private messages
+        self._private: tuple = _build_entry(None, PRIVATE_PREFIXES)
+
+        # guild id -> (custom prefix, prefixes, first characters of prefixes)
+        self._servers = TTLCache(max_size=PREFIX_CACHE_SIZE)
+
+    def bind_user(self, user_id: int) -> None:
+        """
+        Sets id of the bot user used in mention prefixes
+
+        Args:
+            user_id (int): bot user id
+        """
+        if user_id == self.user_id:
+            return
+
+        self.user_id = user_id
+        self._mention_prefixes = (f'<@!{user_id}> ', f'<@{user_id}> ')
+        self._private = _build_entry(
+            None, self._mention_prefixes + PRIVATE_PREFIXES)
+        self._servers.clear()
+
+    def get_prefixes(self, guild_id: int) -> tuple:
+        """
+        Returns prefixes valid in given server
+
+        Args:
+            guild_id (int): guild id, None for private messages
+
+        Returns:
+            tuple: valid prefixes
+        """
+        return self._get_entry(guild_id)[1]
+
+    def could_match(self, guild_id: int, content: str) -> bool:
+        """
+        Fast check whether message content starts with any of prefixes valid in given server
+
+        Args:
+            guild_id (int): guild id, None for private messages
+            content (str): message content
+
+        Returns:
+            bool: False if message can't be a command
+        """
+        _, prefixes, first_chars = self._get_entry(guild_id)
+        return content[:1] in first_chars and content.startswith(prefixes)
+
+    def evict(self, guild_id: int) -> None:
+        """
+        Drops precomputed prefixes of given server
+
+        Args:
+            guild_id (int): guild id
+        """
+        self._servers.evict(guild_id)
+
+    def _get_entry(self, guild_id: int) -> tuple:
+        if guild_id is None:
+            return self._private
+
+        prefix: str = get_server_prefix(guild_id) or DEFAULT_PREFIX
+        entry: tuple = self._servers.get(guild_id)
+
+        # Rebuild only if the prefix has changed
+        if entry is None or entry[0] != prefix:
+            entry = _build_entry(prefix, self._mention_prefixes + (prefix,))
+            self._servers.set(guild_id, entry)
+
+        return entry
+
+
+def _build_entry(prefix: str, prefixes: tuple) -> tuple:
+    first_chars: frozenset = frozenset(value[:1] for value in prefixes)
+    return (prefix, prefixes, first_chars)
+
+
+# Precomputed prefixes used during message dispatch
+prefix_matcher = PrefixMatcher()
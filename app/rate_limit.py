@@ -0,0 +1,64 @@
+"""
+Token bucket rate limiter. Tokens are refilled lazily from the elapsed time,
+so idle buckets cost nothing and no timer task is needed
+"""
+
+# Library includes
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Allows bursts of up to capacity operations and rate operations per second on average
+
+    Args:
+        rate (float): tokens added per second
+        capacity (float, optional): maximal number of stored tokens. Defaults to rate.
+    """
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        self.rate: float = rate
+        self.capacity: float = rate if capacity is None else capacity
+
+        self._tokens: float = self.capacity
+        self._updated: float = time.monotonic()
+        self._lock: asyncio.Lock = None
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """
+        Takes tokens if there are enough of them
+
+        Args:
+            tokens (float, optional): number of tokens. Defaults to 1.0.
+
+        Returns:
+            bool: True if the tokens were taken
+        """
+        self._refill()
+
+        if self._tokens < tokens:
+            return False
+
+        self._tokens -= tokens
+        return True
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """
+        Coroutine that waits until tokens are available and takes them.
+        Waiting callers are served in order
+
+        Args:
+            tokens (float, optional): number of tokens. Defaults to 1.0.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def _refill(self) -> None:
+        now: float = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
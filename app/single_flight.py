@@ -0,0 +1,103 @@
+"""
+Coalescing of concurrent keyed lookups. While a lookup for the key is in flight
+every other caller asking for the same key awaits the very same lookup instead of starting its own
+"""
+
+# Library includes
+import asyncio
+import functools
+
+
+class SingleFlight:
+    """
+    Group of keyed calls where at most one call per key is in flight at once
+
+    Example:
+        flight = SingleFlight()
+        prefix = await flight.do(guild_id, retrieve_prefix, guild_id)
+    """
+
+    def __init__(self) -> None:
+        # Calls that are currently in flight, key -> asyncio.Future
+        self._calls: dict = {}
+
+    def start(self, key, function, *args) -> asyncio.Future:
+        """
+        Starts the call unless call for the key is already in flight. Does not wait for the result
+
+        Args:
+            key (Hashable): key identifying the call
+            function (Callable): coroutine function or function returning awaitable
+            *args: arguments passed to the function
+
+        Returns:
+            asyncio.Future: future of the call in flight
+        """
+        future: asyncio.Future = self._calls.get(key)
+
+        if future is None:
+            future = asyncio.ensure_future(function(*args))
+            self._calls[key] = future
+            future.add_done_callback(functools.partial(self._forget, key))
+
+        return future
+
+    async def do(self, key, function, *args):
+        """
+        Coroutine that awaits result of the call for the key, starting it if needed.
+        Cancelling the caller does not cancel the shared call.
+        Raises asyncio.CancelledError if the shared call was cancelled
+
+        Args:
+            key (Hashable): key identifying the call
+            function (Callable): coroutine function or function returning awaitable
+            *args: arguments passed to the function
+
+        Returns:
+            Result of the call
+        """
+        return await asyncio.shield(self.start(key, function, *args))
+
+    async def do_in_executor(self, key, function, *args):
+        """
+        Same as do() but runs blocking function in the default executor
+
+        Args:
+            key (Hashable): key identifying the call
+            function (Callable): blocking function
+            *args: arguments passed to the function
+
+        Returns:
+            Result of the call
+        """
+        loop = asyncio.get_event_loop()
+        return await self.do(key, loop.run_in_executor, None, function, *args)
+
+    def cancel(self, key) -> bool:
+        """
+        Cancels the call in flight so it will not be shared with next callers
+
+        Args:
+            key (Hashable): key identifying the call
+
+        Returns:
+            bool: True if there was call in flight
+        """
+        future: asyncio.Future = self._calls.pop(key, None)
+
+        if future is None:
+            return False
+
+        future.cancel()
+        return True
+
+    def __contains__(self, key) -> bool:
+        return key in self._calls
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key, future: asyncio.Future) -> None:
+        # Call could have been cancelled and replaced by a newer one
+        if self._calls.get(key) is future:
+            del self._calls[key]
@@ -0,0 +1,338 @@
+"""
+Write-behind queue for firestore documents.
+Writes are coalesced per document in memory and committed in the background
+with batched writes, either periodically or once enough documents are pending
+"""
+
+# Library includes
+import asyncio
+import time
+
+from firebase_admin import firestore
+from google.api_core.exceptions import Aborted, Conflict, DeadlineExceeded, ServiceUnavailable
+
+# Library imports for typing hints
+from google.cloud.firestore import Client as FirestoreClient
+from google.cloud.firestore import WriteBatch
+
+# App includes
+from app.logging.core import Log
+
+
+# Maximal number of operations in single firestore batch
+MAX_BATCH_SIZE: int = 500
+
+# Errors after which the same writes can succeed later, other errors reject the data
+RETRYABLE_ERRORS: tuple = (Aborted, DeadlineExceeded, ServiceUnavailable)
+
+# Maximal seconds between retries of writes that failed with retryable error
+MAX_RETRY_DELAY: float = 60.0
+
+
+class _PendingWrite:
+    """
+    Fields waiting to be written to single document, data is None if document will be deleted.
+    Write following deletion replaces the whole document instead of merging into it
+    """
+    __slots__ = ('data', 'create_only', 'replace')
+
+    def __init__(self, data: dict, create_only: bool, replace: bool = False) -> None:
+        self.data: dict = data
+        self.create_only: bool = create_only
+        self.replace: bool = replace
+
+
+class WriteBehindQueue:
+    """
+    Queue that coalesces writes to firestore documents and commits them in batches
+
+    Args:
+        flush_interval (float, optional): seconds between periodic flushes. Defaults to 2.0.
+        flush_threshold (int, optional): number of pending documents that triggers flush
+            before the interval passes. Defaults to MAX_BATCH_SIZE.
+    """
+
+    def __init__(self, *, flush_interval: float = 2.0,
+                 flush_threshold: int = MAX_BATCH_SIZE) -> None:
+        self.flush_interval: float = flush_interval
+        self.flush_threshold: int = flush_threshold
+
+        # Document path -> _PendingWrite
+        self._pending: dict = {}
+
+        self._runner: asyncio.Task = None
+        self._wakeup: asyncio.Event = None
+        self._closing: bool = False
+        self._flush_lock: asyncio.Lock = None
+
+        # Seconds to wait before retrying failed writes, 0 if the last flush succeeded
+        self._retry_delay: float = 0.0
+        self._retry_at: float = 0.0
+
+        # Statistics
+        self.enqueued: int = 0
+        self.committed: int = 0
+        self.batches: int = 0
+
+    def set(self, path: str, data: dict) -> None:
+        """
+        Schedules merge of given fields into the document.
+        Fields pending for the same document are merged, newer values win.
+        If the document deletion is pending, the document is replaced by the fields
+
+        Args:
+            path (str): path to the document
+            data (dict): fields to be written
+        """
+        pending: _PendingWrite = self._pending.get(path)
+
+        if pending is None:
+            self._pending[path] = _PendingWrite(dict(data), False)
+        elif pending.data is None:
+            self._pending[path] = _PendingWrite(dict(data), False, replace=True)
+        else:
+            pending.data.update(data)
+            pending.create_only = False
+
+        self._enqueued()
+
+    def delete(self, path: str) -> None:
+        """
+        Schedules deletion of the document, discarding writes to it that are still pending
+
+        Args:
+            path (str): path to the document
+        """
+        self._pending[path] = _PendingWrite(None, False)
+        self._enqueued()
+
+    def create(self, path: str, data: dict) -> None:
+        """
+        Schedules creation of the document. Nothing is written if the document exists
+        by the time of the flush or if any other write to it is already pending.
+        If the document deletion is pending, the document is replaced by the fields
+
+        Args:
+            path (str): path to the document
+            data (dict): document fields
+        """
+        pending: _PendingWrite = self._pending.get(path)
+
+        if pending is not None and pending.data is None:
+            self._pending[path] = _PendingWrite(dict(data), False, replace=True)
+            self._enqueued()
+            return
+
+        if pending is not None:
+            return
+
+        self._pending[path] = _PendingWrite(dict(data), True)
+        self._enqueued()
+
+    async def flush(self) -> None:
+        """
+        Coroutine that commits all pending writes
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            pending, self._pending = self._pending, {}
+            Log.debug('Flushing %s pending document writes', len(pending))
+
+            loop = asyncio.get_event_loop()
+            items: list = list(pending.items())
+            retry: list = []
+
+            for start in range(0, len(items), MAX_BATCH_SIZE):
+                chunk: list = items[start:start + MAX_BATCH_SIZE]
+
+                try:
+                    await loop.run_in_executor(None, _commit, chunk)
+                except RETRYABLE_ERRORS as exc:
+                    Log.warning('Could not commit %s document writes: %s', len(chunk), exc)
+                    retry.extend(chunk)
+                    continue
+                except Exception:  # pylint: disable=broad-except
+                    # Single rejected document fails the whole batch, the others are saved
+                    Log.error('Could not commit %s document writes, committing them one by one',
+                              len(chunk), exc_info=True)
+                    retry.extend(await self._commit_each(chunk))
+                    continue
+                except BaseException:
+                    # Cancelled flush keeps writes that were not committed yet
+                    self._requeue(retry + items[start:])
+                    raise
+
+                self.committed += len(chunk)
+                self.batches += 1
+
+            self._requeue(retry)
+            self._schedule_retry(bool(retry))
+
+    async def _commit_each(self, chunk: list) -> list:
+        """
+        Coroutine that commits writes of the chunk one by one.
+        Writes rejected by firestore are dropped
+
+        Args:
+            chunk (list): list of (path, _PendingWrite) pairs
+
+        Returns:
+            list: writes that failed with retryable error
+        """
+        loop = asyncio.get_event_loop()
+        retry: list = []
+
+        for index, item in enumerate(chunk):
+            try:
+                await loop.run_in_executor(None, _commit, [item])
+            except RETRYABLE_ERRORS:
+                retry.append(item)
+                continue
+            except Exception as exc:  # pylint: disable=broad-except
+                Log.error('Dropping rejected write to document %s: %r', item[0], exc)
+                continue
+            except BaseException:
+                retry.extend(chunk[index:])
+                self._requeue(retry)
+                raise
+
+            self.committed += 1
+            self.batches += 1
+
+        return retry
+
+    def _schedule_retry(self, failed: bool) -> None:
+        # Failing writes are retried with exponential backoff, success resets it
+        if not failed:
+            self._retry_delay = 0.0
+            return
+
+        self._retry_delay = min(max(self._retry_delay * 2, self.flush_interval), MAX_RETRY_DELAY)
+        self._retry_at = time.monotonic() + self._retry_delay
+
+    async def close(self) -> None:
+        """
+        Coroutine that stops periodic flushing and commits remaining writes
+        """
+        if self._runner is not None:
+            # Let the runner finish flush that may be in progress
+            self._closing = True
+            self._wakeup.set()
+            await self._runner
+            self._runner = None
+
+        await self.flush()
+
+    def stats(self) -> dict:
+        """
+        Returns queue statistics
+
+        Returns:
+            dict: pending, enqueued and committed writes and number of committed batches
+        """
+        return {
+            'pending': len(self._pending),
+            'enqueued': self.enqueued,
+            'committed': self.committed,
+            'batches': self.batches,
+        }
+
+    def _enqueued(self) -> None:
+        self.enqueued += 1
+
+        # Start flushing in the background on first write
+        if self._runner is None:
+            self._closing = False
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.ensure_future(self._run())
+
+        if len(self._pending) >= self.flush_threshold:
+            self._wakeup.set()
+
+    def _requeue(self, chunk: list) -> None:
+        # Writes that were enqueued in the meantime are newer and take precedence
+        for path, write in chunk:
+            pending: _PendingWrite = self._pending.get(path)
+
+            if pending is None:
+                self._pending[path] = write
+            elif pending.data is None or write.create_only:
+                continue
+            elif write.data is None:
+                # Deletion followed by newer write replaces the document
+                pending.create_only = False
+                pending.replace = True
+            elif pending.create_only:
+                self._pending[path] = write
+            else:
+                pending.data = {**write.data, **pending.data}
+                pending.replace = pending.replace or write.replace
+
+    async def _run(self) -> None:
+        while not self._closing:
+            timeout: float = self.flush_interval
+            if self._retry_delay:
+                timeout = max(self._retry_at - time.monotonic(), 0.0)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+
+            # Full queue does not cut the backoff short, closing does
+            if self._retry_delay and not self._closing and time.monotonic() < self._retry_at:
+                continue
+
+            # Failed flush is logged by flush(), the runner must keep flushing later writes
+            try:
+                await self.flush()
+            except Exception:  # pylint: disable=broad-except
+                Log.error('Flushing of document writes failed', exc_info=True)
+
+
+def _commit(chunk: list) -> None:
+    """
+    Commits chunk of pending writes. This call is blocking and should be run in executor
+
+    Args:
+        chunk (list): list of (path, _PendingWrite) pairs
+    """
+    db_client: FirestoreClient = firestore.client()
+
+    writes: list = [(path, write) for path, write in chunk if not write.create_only]
+    creates: list = [(path, write) for path, write in chunk if write.create_only]
+
+    if writes:
+        batch: WriteBatch = db_client.batch()
+        for path, write in writes:
+            if write.data is None:
+                batch.delete(db_client.document(path))
+            else:
+                batch.set(db_client.document(path), write.data, merge=not write.replace)
+        batch.commit()
+
+    if creates:
+        batch: WriteBatch = db_client.batch()
+        for path, write in creates:
+            batch.create(db_client.document(path), write.data)
+
+        try:
+            batch.commit()
+        except Conflict:
+            # Whole batch fails if any document exists, create them one by one
+            for path, write in creates:
+                try:
+                    db_client.document(path).create(write.data)
+                except Conflict:
+                    pass
+
+
+# Write queue shared by whole application
+write_queue = WriteBehindQueue()
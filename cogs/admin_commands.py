@@ -2,6 +2,12 @@
 Cog that holds command that will be only used by the discord server administrators
 """
 # Library includes
+from typing import List, Optional
+import asyncio
+import gzip
+import io
+
+import discord
 from discord.ext import commands
 
 
@@ -10,7 +16,15 @@ from discord.ext import commands
 from app.client import BotClient
 from app.logging.core import Log
 
-from app.prefix_handler import set_server_prefix
+from app.prefix_handler import set_server_prefix, resolve_server_prefix, DEFAULT_PREFIX
+from app.logging.ring_buffer import BufferedRecord
+
+
+# Name of the uploaded log dump
+LOG_DUMP_FILENAME: str = 'bot-logs.txt'
+
+# Upload limit of direct messages and servers without boosts
+DEFAULT_FILESIZE_LIMIT: int = 8 * 1024 * 1024
 
 
 class AdminCommands(commands.Cog, name='Admin Commands'):
@@ -44,7 +58,7 @@ class AdminCommands(commands.Cog, name='Admin Commands'):
         """
         guild_id: int = context.guild.id
         Log.info(
-            f'Changing prefix in guild "{context.guild.name} to "{new_prefix}"')
+            'Changing prefix in guild "%s" to "%s"', context.guild.name, new_prefix)
 
         set_server_prefix(guild_id, new_prefix)
 
@@ -60,9 +74,78 @@ class AdminCommands(commands.Cog, name='Admin Commands'):
         Args:
             context (commands.Context): context of the invocation
         """
-        curr_prefix: str = (await self.client.get_prefix(context))[2]
+        # Wait for the prefix so cold cache does not report the default one
+        curr_prefix: str = await resolve_server_prefix(context.guild.id) or DEFAULT_PREFIX
         await context.send(f'Current prefix is set to "{curr_prefix}"')
 
+    @prefix_core.command(name='stats', brief='Prints prefix cache and prefilter statistics')
+    @commands.has_permissions(administrator=True)
+    @commands.guild_only()
+    async def prefix_stats(self, context: commands.Context):
+        """
+        Prints statistics of the server prefix cache and the message prefilter
+
+        Args:
+            context (commands.Context): context of the invocation
+        """
+        stats: dict = self.client.prefix_cache.stats()
+        lines: str = '\n'.join(f'{key}: {value}' for key, value in stats.items())
+
+        prefilter_lines: str = '\n'.join(
+            f'{stage}: {count}' for stage, count in self.client.prefilter_stats.most_common())
+
+        write_lines: str = '\n'.join(
+            f'{key}: {value}' for key, value in self.client.write_queue.stats().items())
+
+        await context.send(
+            f'Prefix cache:\n```\n{lines}\n```\n'
+            f'Message prefilter:\n```\n{prefilter_lines or "no messages"}\n```\n'
+            f'Write queue:\n```\n{write_lines}\n```')
+
+    @commands.command(name='logs', brief='Uploads recent log messages')
+    @commands.is_owner()
+    async def logs_dump(self, context: commands.Context,
+                        guild_id: Optional[int] = None, logger: str = None):
+        """
+        Uploads messages kept by the log ring buffer, including levels that are not printed.
+        The buffer holds messages of all servers, so only the bot owner can read it
+
+        Args:
+            context (commands.Context): context of the invocation
+            guild_id (int, optional): only messages of the guild. Defaults to all guilds.
+            logger (str, optional): only messages of the logger. Defaults to all loggers.
+        """
+        if Log.ring_buffer is None:
+            await context.send('Log buffer is disabled')
+            return
+
+        records: List[BufferedRecord] = Log.ring_buffer.records(guild_id=guild_id, logger=logger)
+
+        if not records:
+            await context.send('No matching log messages')
+            return
+
+        def render() -> bytes:
+            return '\n'.join(record.format() for record in records).encode('utf-8')
+
+        loop = asyncio.get_event_loop()
+        content: bytes = await loop.run_in_executor(None, render)
+        filename: str = LOG_DUMP_FILENAME
+
+        limit: int = context.guild.filesize_limit if context.guild else DEFAULT_FILESIZE_LIMIT
+        if len(content) > limit:
+            content = await loop.run_in_executor(None, gzip.compress, content)
+            filename += '.gz'
+
+        if len(content) > limit:
+            await context.send('Log dump is too large to be uploaded, use filters')
+            return
+
+        Log.info('Uploading %s buffered log messages', len(records))
+        await context.send(
+            f'{len(records)} log messages',
+            file=discord.File(io.BytesIO(content), filename=filename))
+
 
 def setup(client):
     """
@@ -3,17 +3,67 @@ Main calendar cog
 """
 # Library includes
 import asyncio
+import io
+import tempfile
+from datetime import datetime, timezone
 from typing import List
 
 
+import aiohttp
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 
 # App includes
 
 from app.client import BotClient
-from modules.calendar.calendar_handler import load_guild_latest, next_uid
+from app.conversation import Conversation, ConversationAlreadyOpen
+from modules.calendar.calendar_handler import next_uid, next_events, add_event, delete_event
+from modules.calendar.calendar_handler import evict_idle_indexes, reminder_scheduler
+from modules.calendar.calendar_handler import EventPager, set_recurrence, skip_occurrence
+from modules.calendar.calendar_handler import export_events, import_events
+from modules.calendar.calendar_handler import events_happening, find_conflicts
+from modules.calendar.calendar_handler import get_guild_index, reminder_subscribers
+from modules.calendar.calendar_handler import subscribe_reminder, unsubscribe_reminder
+from modules.calendar.recurrence import FREQUENCIES
+from modules.calendar.agenda import AgendaSubscription, agenda_scheduler, get_zone
+from modules.calendar.rsvp import RSVP_EMOJI, rsvp_tracker
+from modules.calendar.event_index import EventRecord, MAX_EVENT_DURATION
+
+
+# Format in which users enter event time
+TIME_FORMAT: str = '%Y-%m-%d %H:%M'
+
+# Seconds to wait for user reply in the add wizard
+WIZARD_TIMEOUT: float = 120.0
+
+# Seconds after which messages of the add wizard are deleted
+WIZARD_CLEANUP_DELAY: float = 10.0
+
+# Number of events on single page of calendar list
+LIST_PAGE_SIZE: int = 10
+
+# Seconds after which calendar list stops reacting to page changes
+LIST_TIMEOUT: float = 120.0
+
+# Reactions used to change pages
+PREVIOUS_PAGE: str = '\u25c0'
+NEXT_PAGE: str = '\u25b6'
+
+# Name of the exported calendar file
+EXPORT_FILENAME: str = 'calendar.ics'
+
+# Maximal size in bytes of imported iCalendar file
+IMPORT_MAX_SIZE: int = 8 * 1024 * 1024
+
+# Size in bytes of chunks in which imported file is downloaded
+IMPORT_CHUNK_SIZE: int = 64 * 1024
+
+# Discord embed limits
+EMBED_MAX_DESCRIPTION: int = 2048
+EMBED_MAX_FIELDS: int = 25
+EMBED_MAX_TOTAL: int = 6000
+EMBED_MAX_FIELD_VALUE: int = 1024
 
 
 class Calendar(commands.Cog, name='Calendar'):
@@ -25,6 +75,126 @@ class Calendar(commands.Cog, name='Calendar'):
         self.client: BotClient = client
         self.log = client.log
 
+        self.evict_indexes.start()
+
+        # Due events are announced through on_calendar_event_due listeners
+        reminder_scheduler.start(
+            lambda guild_id, record: client.dispatch('calendar_event_due', guild_id, record))
+
+        agenda_scheduler.start(self.post_agenda)
+
+        # Pending RSVP changes are written before the bot disconnects
+        client.close_hooks.append(rsvp_tracker.close)
+
+    def cog_unload(self):
+        self.evict_indexes.cancel()
+        reminder_scheduler.stop()
+        agenda_scheduler.stop()
+
+        self.client.close_hooks.remove(rsvp_tracker.close)
+        asyncio.ensure_future(rsvp_tracker.close())
+
+    @tasks.loop(minutes=5)
+    async def evict_indexes(self):
+        """
+        Periodically drops event indexes of guilds that are not used
+        """
+        evict_idle_indexes()
+
+    @commands.Cog.listener()
+    async def on_calendar_event_due(self, guild_id: int, record: EventRecord):
+        """
+        Announces the event in the channel it was created in and sends direct message
+        to subscribed users. Subscribers are reminded even if the announcement fails
+
+        Args:
+            guild_id (int): guild id
+            record (EventRecord): event that is due
+        """
+        channel: discord.TextChannel = self.client.get_channel(record.channel_id)
+
+        if channel is None:
+            self.log.warning(
+                'Channel of calendar event %s in guild %s is not available', record.id, guild_id)
+        else:
+            try:
+                await channel.send(f'Event `{record.id}` is starting now: {record.description}')
+            except discord.HTTPException as exc:
+                self.log.warning('Could not announce calendar event %s in guild %s: %s',
+                                 record.id, guild_id, exc)
+
+        subscribers: List[int] = await reminder_subscribers(guild_id, record.id)
+
+        if subscribers:
+            guild: discord.Guild = self.client.get_guild(guild_id)
+            guild_name: str = guild.name if guild is not None else 'server'
+
+            await self.client.fanout.send(
+                subscribers,
+                f'Event `{record.id}` in **{guild_name}** is starting now: '
+                f'{record.description}')
+
+    async def post_agenda(self, subscription: AgendaSubscription, day_start: float,
+                          records: List[EventRecord]):
+        """
+        Posts daily agenda of the guild, called by the agenda scheduler
+
+        Args:
+            subscription (AgendaSubscription): agenda settings of the guild
+            day_start (float): POSIX timestamp of the local midnight
+            records (List[EventRecord]): events of the day
+        """
+        channel: discord.TextChannel = self.client.get_channel(subscription.channel_id)
+
+        if channel is None:
+            self.log.warning(
+                'Agenda channel of guild %s is not available', subscription.guild_id)
+            return
+
+        await channel.send(embed=_agenda_embed(subscription, day_start, records))
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        await self._record_rsvp(payload, True)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        await self._record_rsvp(payload, False)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_clear(self, payload: discord.RawReactionClearEvent):
+        await self._clear_rsvp(payload)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_clear_emoji(self, payload: discord.RawReactionClearEmojiEvent):
+        if str(payload.emoji) == RSVP_EMOJI:
+            await self._clear_rsvp(payload)
+
+    async def _record_rsvp(self, payload: discord.RawReactionActionEvent, attending: bool):
+        # Cheap checks first, only RSVP reactions of users in guilds can be RSVP.
+        # Member is known only for added reactions, removing is harmless for non-attending bots
+        if (str(payload.emoji) != RSVP_EMOJI or payload.guild_id is None
+                or payload.user_id == self.client.user.id
+                or (payload.member is not None and payload.member.bot)):
+            return
+
+        post: tuple = await rsvp_tracker.resolve_post(payload.guild_id, payload.message_id)
+
+        if post is not None:
+            guild_id, event_id = post
+            rsvp_tracker.record(guild_id, event_id, payload.user_id, attending)
+
+    async def _clear_rsvp(self, payload: discord.RawReactionClearEvent):
+        # Reactions are removed at once without reporting users, so everybody stops attending
+        if payload.guild_id is None:
+            return
+
+        post: tuple = await rsvp_tracker.resolve_post(payload.guild_id, payload.message_id)
+
+        if post is not None:
+            guild_id, event_id = post
+            await rsvp_tracker.clear(guild_id, event_id)
+
     @commands.group(name='calendar', brief='Manages calendar')
     @commands.guild_only()
     async def calendar_core(self, context: commands.Context):
@@ -35,12 +205,8 @@ class Calendar(commands.Cog, name='Calendar'):
     @calendar_core.command(name='add', brief='Adds event to calendar')
     async def add(self, context: commands.Context):
 
-        # Binding logger
-        log = self.log
-
         # Holder for message for later deletion
         message_stack: List[discord.Message] = [context.message]
-        log = self.log
 
         # Used to communicate in desired channel
         async def talk(*args, **kwargs) -> discord.Message:
@@ -50,39 +216,467 @@ class Calendar(commands.Cog, name='Calendar'):
             )
             return send_message
 
-        # Delete messages
-        async def clenup():
-            await asyncio.sleep(10)
-            for message in message_stack:
-                await message.delete()
+        try:
+            conversation: Conversation = self.client.conversations.open(
+                context.channel.id, context.author.id)
+        except ConversationAlreadyOpen:
+            await context.reply('Please finish adding the previous event first')
+            return
+
+        async with conversation:
+            # Waits for the author reply
+            async def ask(question: str) -> str:
+                await talk(question)
+                reply: discord.Message = await conversation.wait_for_reply(WIZARD_TIMEOUT)
+                message_stack.append(reply)
+                return reply.content
+
+            try:
+                description: str = await ask('Please reply with __Description__')
+                time_reply: str = await ask(
+                    f'Please reply with __Time__ (UTC) in format `{TIME_FORMAT}`')
+                duration_reply: str = await ask(
+                    'Please reply with __Duration__ in minutes (`0` if the event has no duration)')
+            except asyncio.TimeoutError:
+                await talk('Timed Out!')
+            else:
+                try:
+                    event_time: datetime = datetime.strptime(
+                        time_reply.strip(), TIME_FORMAT).replace(tzinfo=timezone.utc)
+                    duration: float = float(duration_reply.strip()) * 60
+                    if not 0 <= duration <= MAX_EVENT_DURATION:
+                        raise ValueError(duration)
+                except ValueError:
+                    await talk('Invalid time or duration!')
+                else:
+                    conflicts: List[EventRecord] = await find_conflicts(
+                        context.guild.id, event_time.timestamp(), duration)
+
+                    record: EventRecord = await add_event(
+                        context.guild.id, event_time.timestamp(), description,
+                        context.channel.id, duration)
+                    await context.send(f'Added event `{record.id}`: {description}')
+
+                    if conflicts:
+                        await context.send(
+                            'Warning, the event overlaps with events: '
+                            + ', '.join(f'`{conflict.id}`' for conflict in conflicts))
+
+        # Delete messages in the background
+        self.client.deletion_service.schedule(message_stack, delay=WIZARD_CLEANUP_DELAY)
+
+    @calendar_core.command(name='next', brief='Shows upcoming events')
+    async def next_command(self, context: commands.Context, count: int = 5):
+        records: List[EventRecord] = await next_events(context.guild.id, max(1, min(count, 25)))
+
+        if not records:
+            await context.send('There are no upcoming events')
+            return
+
+        await context.send(embed=_events_embed('Upcoming events', records))
+
+    @calendar_core.command(name='now', brief='Shows events in progress')
+    async def now(self, context: commands.Context):
+        records: List[EventRecord] = await events_happening(context.guild.id)
+
+        if not records:
+            await context.send('There are no events in progress')
+            return
+
+        await context.send(embed=_events_embed('Happening now', records))
+
+    @calendar_core.command(name='list', brief='Lists upcoming events page by page')
+    async def list_command(self, context: commands.Context):
+        pager = EventPager(context.guild.id, LIST_PAGE_SIZE)
+
+        # Pages that were already fetched
+        pages: List[List[EventRecord]] = [await pager.next_page()]
 
-        # Verifies the author replies
+        if not pages[0]:
+            await context.send('There are no upcoming events')
+            return
 
-        def check(message: discord.Message) -> bool:
-            is_correct_user: bool = message.author == context.author
-            is_correct_channel: bool = message.channel == context.channel
+        page_index: int = 0
 
-            return is_correct_user and is_correct_channel
+        def render() -> discord.Embed:
+            is_last: bool = not pager.has_more and page_index == len(pages) - 1
+            footer: str = f'Page {page_index + 1}' + (' (last)' if is_last else '')
+            return _events_embed('Calendar', pages[page_index], footer)
 
-        await talk('Please reply with __Description__')
+        message: discord.Message = await context.send(embed=render())
+
+        if not pager.has_more:
+            return
+
+        await message.add_reaction(PREVIOUS_PAGE)
+        await message.add_reaction(NEXT_PAGE)
+
+        def check(reaction: discord.Reaction, user: discord.User) -> bool:
+            return (reaction.message.id == message.id and user == context.author
+                    and str(reaction.emoji) in (PREVIOUS_PAGE, NEXT_PAGE))
+
+        while True:
+            try:
+                reaction, user = await self.client.wait_for(
+                    'reaction_add', check=check, timeout=LIST_TIMEOUT)
+            except asyncio.TimeoutError:
+                break
+
+            if str(reaction.emoji) == PREVIOUS_PAGE:
+                page_index = max(page_index - 1, 0)
+            elif page_index + 1 < len(pages):
+                page_index += 1
+            elif pager.has_more:
+                # Next page is fetched only when user asks for it
+                records: List[EventRecord] = await pager.next_page()
+
+                if records:
+                    pages.append(records)
+                    page_index += 1
+
+            await message.edit(embed=render())
+
+            try:
+                await message.remove_reaction(reaction.emoji, user)
+            except discord.Forbidden:
+                pass
 
         try:
-            user_reaction: discord.Message = await self.client.wait_for(
-                event='message',
-                check=check
-            )
-            message_stack.append(user_reaction)
-            await talk(f'Message content is `{user_reaction.content}`')
-        except asyncio.TimeoutError:
-            await talk(f'Timed Out!')
-            await clenup()
+            await message.clear_reactions()
+        except discord.Forbidden:
+            pass
+
+    @calendar_core.command(name='repeat', brief='Makes event recurring')
+    async def repeat(self, context: commands.Context, event_id: int, freq: str,
+                     interval: int = 1):
+        """
+        Makes the event repeat daily, weekly or monthly, "none" stops the recurrence
+        """
+        freq = freq.lower()
+
+        if freq not in FREQUENCIES and freq != 'none':
+            await context.send(f'Frequency has to be one of: {", ".join(FREQUENCIES)}, none')
+            return
+
+        record: EventRecord = await set_recurrence(
+            context.guild.id, event_id, None if freq == 'none' else freq, interval)
+
+        if record is None:
+            await context.send(f'There is no event `{event_id}`')
+        elif record.recurrence is None:
+            await context.send(f'Event `{event_id}` no longer repeats')
+        else:
+            # Interval may be clamped, the stored rule is reported
+            rule = record.recurrence
+            await context.send(f'Event `{event_id}` repeats {rule.freq} every {rule.interval}')
+
+    @calendar_core.command(name='skip', brief='Skips single occurrence of recurring event')
+    async def skip(self, context: commands.Context, event_id: int, *, occurrence: str):
+        try:
+            occurrence_time: datetime = datetime.strptime(
+                occurrence.strip(), TIME_FORMAT).replace(tzinfo=timezone.utc)
+        except ValueError:
+            await context.send(f'Invalid time format, use `{TIME_FORMAT}`')
+            return
+
+        try:
+            record: EventRecord = await skip_occurrence(
+                context.guild.id, event_id, occurrence_time.timestamp())
+        except ValueError:
+            await context.send(f'Event `{event_id}` does not occur on {occurrence}')
+            return
 
-        await clenup()
+        if record is None:
+            await context.send(f'There is no recurring event `{event_id}`')
+        else:
+            await context.send(f'Occurrence of event `{event_id}` on {occurrence} is skipped')
+
+    @calendar_core.command(name='export', brief='Exports calendar as iCalendar file')
+    async def export(self, context: commands.Context):
+        loop = asyncio.get_event_loop()
+
+        # Events created recently may still wait in the write queue
+        await self.client.write_queue.flush()
+
+        # The file is written to disk as events are read and uploaded from there
+        with tempfile.TemporaryFile() as file:
+            def write() -> int:
+                output = io.TextIOWrapper(file, encoding='utf-8', newline='')
+                count: int = export_events(context.guild.id, output)
+                output.flush()
+                output.detach()
+                return count
+
+            async with context.typing():
+                count: int = await loop.run_in_executor(None, write)
+
+            if file.tell() > context.guild.filesize_limit:
+                await context.send('Calendar is too large to be uploaded')
+                return
+
+            file.seek(0)
+            await context.send(
+                f'Exported {count} events', file=discord.File(file, filename=EXPORT_FILENAME))
+
+    @calendar_core.command(name='import', brief='Imports events from attached iCalendar file')
+    async def import_command(self, context: commands.Context):
+        """
+        Imports every event of the attached .ics file, events are announced in this channel
+        """
+        attachments: List[discord.Attachment] = [
+            attachment for attachment in context.message.attachments
+            if attachment.filename.lower().endswith('.ics')]
+
+        if not attachments:
+            await context.reply('Please attach `.ics` file')
+            return
+
+        if any(attachment.size > IMPORT_MAX_SIZE for attachment in attachments):
+            max_size: int = IMPORT_MAX_SIZE // (1024 * 1024)
+            await context.reply(f'Calendar files larger than {max_size} MB are not supported')
+            return
+
+        imported: int = 0
+        skipped: int = 0
+
+        async with context.typing():
+            for attachment in attachments:
+                # Attachment is streamed to disk and parsed from there line by line
+                with tempfile.TemporaryFile() as file:
+                    try:
+                        await _download(attachment, file)
+                    except aiohttp.ClientError as exc:
+                        self.log.warning('Could not download calendar file: %s', exc)
+                        await context.reply(f'Could not download `{attachment.filename}`')
+                        continue
+
+                    file.seek(0)
+
+                    source = io.TextIOWrapper(file, encoding='utf-8', errors='replace', newline='')
+                    added, invalid = await import_events(
+                        context.guild.id, source, context.channel.id)
+                    source.detach()
+
+                imported += added
+                skipped += invalid
+
+        message: str = f'Imported {imported} events'
+        if skipped:
+            message += f', skipped {skipped} invalid events'
+        await context.send(message)
+
+    @calendar_core.group(name='agenda', brief='Manages daily agenda',
+                         invoke_without_command=True)
+    async def agenda(self, context: commands.Context):
+        subscription: AgendaSubscription = agenda_scheduler.get(context.guild.id)
+
+        if subscription is None:
+            await context.send('Daily agenda is turned off')
+        else:
+            await context.send(
+                f'Daily agenda is posted in <#{subscription.channel_id}> '
+                f'at midnight {subscription.timezone}')
+
+    @agenda.command(name='set', brief='Posts daily agenda in the channel')
+    @commands.has_permissions(manage_guild=True)
+    async def agenda_set(self, context: commands.Context, channel: discord.TextChannel,
+                         timezone_name: str = 'UTC'):
+        """
+        Turns on daily agenda posted at local midnight of the timezone, e.g. Europe/Warsaw
+        """
+        try:
+            agenda_scheduler.subscribe(context.guild.id, channel.id, timezone_name)
+        except ValueError:
+            await context.send(f'Unknown timezone `{timezone_name}`')
+            return
+
+        await context.send(
+            f'Daily agenda will be posted in {channel.mention} at midnight {timezone_name}')
+
+    @agenda.command(name='off', brief='Turns off daily agenda')
+    @commands.has_permissions(manage_guild=True)
+    async def agenda_off(self, context: commands.Context):
+        if agenda_scheduler.unsubscribe(context.guild.id):
+            await context.send('Daily agenda is turned off')
+        else:
+            await context.send('Daily agenda was not turned on')
+
+    @calendar_core.command(name='rsvp', brief='Posts event for users to sign up')
+    async def rsvp(self, context: commands.Context, event_id: int):
+        """
+        Posts the event, users attending the event react to the post
+        """
+        index = await get_guild_index(context.guild.id)
+        record: EventRecord = index.get(event_id)
+
+        if record is None:
+            await context.send(f'There is no event `{event_id}`')
+            return
+
+        embed: discord.Embed = _events_embed(
+            'Are you attending?', [record], f'React with {RSVP_EMOJI} to attend')
+        message: discord.Message = await context.send(embed=embed)
+
+        rsvp_tracker.register_post(message.id, context.guild.id, event_id)
+        await message.add_reaction(RSVP_EMOJI)
+
+    @calendar_core.command(name='attendees', brief='Lists users attending event')
+    async def attendees(self, context: commands.Context, event_id: int):
+        users: List[int] = await rsvp_tracker.attendees(context.guild.id, event_id)
+
+        if not users:
+            await context.send(f'Nobody is attending event `{event_id}` yet')
+            return
+
+        mentions: str = ', '.join(f'<@{user_id}>' for user_id in users)
+        if len(mentions) > EMBED_MAX_DESCRIPTION:
+            mentions = mentions[:EMBED_MAX_DESCRIPTION - 1] + '\u2026'
+
+        await context.send(embed=discord.Embed(
+            title=f'{len(users)} attending event {event_id}',
+            description=mentions,
+            colour=discord.Color.dark_gold()
+        ))
+
+    @calendar_core.command(name='remind-me', brief='Sends you direct message when event starts')
+    async def remind_me(self, context: commands.Context, event_id: int, setting: str = 'on'):
+        """
+        Opts you in to direct message when the event starts, use "off" to opt out
+        """
+        index = await get_guild_index(context.guild.id)
+
+        if index.get(event_id) is None:
+            await context.send(f'There is no event `{event_id}`')
+            return
+
+        if setting.lower() == 'off':
+            unsubscribe_reminder(context.guild.id, event_id, context.author.id)
+            await context.reply(f'You will not be reminded about event `{event_id}`')
+        else:
+            subscribe_reminder(context.guild.id, event_id, context.author.id)
+            await context.reply(f'You will get direct message when event `{event_id}` starts')
+
+    @calendar_core.command(name='delete', brief='Deletes event')
+    async def delete(self, context: commands.Context, event_id: int):
+        record: EventRecord = await delete_event(context.guild.id, event_id)
+
+        if record is None:
+            await context.send(f'There is no event `{event_id}`')
+        else:
+            await context.send(f'Deleted event `{event_id}`')
 
     @calendar_core.command(name='test', brief='For testing only')
     async def test(self, context: commands.Context):
         for _ in range(10):
-            await context.send(f'ID: {next_uid(context.guild.id)}')
+            await context.send(f'ID: {await next_uid(context.guild.id)}')
+
+
+async def _download(attachment: discord.Attachment, file) -> None:
+    """
+    Coroutine that writes the attachment to the file chunk by chunk,
+    unlike Attachment.save which reads the whole attachment to memory
+
+    Args:
+        attachment (discord.Attachment): downloaded attachment
+        file (BinaryIO): file opened for binary writing
+
+    Raises:
+        aiohttp.ClientError: Raised if the download failed
+    """
+    async with aiohttp.ClientSession() as session:
+        async with session.get(attachment.url, raise_for_status=True) as response:
+            async for chunk in response.content.iter_chunked(IMPORT_CHUNK_SIZE):
+                file.write(chunk)
+
+
+def _events_embed(title: str, records: List[EventRecord], footer: str = None) -> discord.Embed:
+    """
+    Renders events into embed that respects discord limits on number of fields and total length.
+    Descriptions are shortened so every event fits, events that would not fit are left out
+
+    Args:
+        title (str): embed title
+        records (List[EventRecord]): events to be shown
+        footer (str, optional): embed footer
+
+    Returns:
+        discord.Embed: embed with one field per event
+    """
+    embed = discord.Embed(
+        title=title,
+        colour=discord.Color.dark_gold()
+    )
+
+    budget: int = EMBED_MAX_TOTAL - len(title) - len(footer or '')
+    records = records[:EMBED_MAX_FIELDS]
+
+    for position, record in enumerate(records):
+        event_time: str = datetime.fromtimestamp(
+            record.time, tz=timezone.utc).strftime(TIME_FORMAT)
+        name: str = f'`{record.id}` {event_time} UTC'
+
+        if record.duration > 0:
+            end_time: str = datetime.fromtimestamp(
+                record.end, tz=timezone.utc).strftime(TIME_FORMAT)
+            name += f' - {end_time} UTC'
+
+        # Share the remaining length equally among the remaining events
+        value_limit: int = min(
+            EMBED_MAX_FIELD_VALUE,
+            budget // (len(records) - position) - len(name))
+
+        if value_limit < 1:
+            break
+
+        value: str = record.description or '-'
+        if len(value) > value_limit:
+            value = value[:value_limit - 1] + '\u2026'
+
+        embed.add_field(name=name, value=value, inline=False)
+        budget -= len(name) + len(value)
+
+    if footer:
+        embed.set_footer(text=footer)
+
+    return embed
+
+
+def _agenda_embed(subscription: AgendaSubscription, day_start: float,
+                  records: List[EventRecord]) -> discord.Embed:
+    """
+    Renders events of the day into single embed, times are shown in the guild timezone
+
+    Args:
+        subscription (AgendaSubscription): agenda settings of the guild
+        day_start (float): POSIX timestamp of the local midnight
+        records (List[EventRecord]): events of the day
+
+    Returns:
+        discord.Embed: the agenda
+    """
+    zone = get_zone(subscription.timezone)
+    day: str = datetime.fromtimestamp(day_start, tz=zone).strftime('%A %Y-%m-%d')
+
+    lines: List[str] = []
+    length: int = 0
+
+    for position, record in enumerate(records):
+        start: str = datetime.fromtimestamp(record.time, tz=zone).strftime('%H:%M')
+        line: str = f'`{start}` `{record.id}` {record.description}'
+
+        # Leave room for the note about the omitted events
+        if length + len(line) + 1 > EMBED_MAX_DESCRIPTION - 40:
+            lines.append(f'\u2026 and {len(records) - position} more')
+            break
+
+        lines.append(line)
+        length += len(line) + 1
+
+    return discord.Embed(
+        title=f'Agenda for {day}',
+        description='\n'.join(lines) or 'No events today',
+        colour=discord.Color.dark_gold()
+    )
 
 
 def setup(client):
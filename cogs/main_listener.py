@@ -4,12 +4,17 @@ Extension that contains event listeners that do not fall under their own categor
 
 
 # Library includes
+from datetime import datetime
+import logging
+
 from discord.ext import commands
+import discord
 
 
 # App includes
 from app.client import BotClient
 from app.logging.core import Log
+from app.prefix_handler import evict_server_prefix, prefetch_server_prefixes, resolve_server_prefix
 
 
 class ListenerCog(commands.Cog):
@@ -28,6 +33,51 @@ class ListenerCog(commands.Cog):
         Log.info('Bot is ready')
         Log.info(self.client.emojis)
 
+        # Warm up prefix cache for every server the bot is in
+        await prefetch_server_prefixes([guild.id for guild in self.client.guilds])
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx: commands.Context):
+        """
+        Logs finished command with structured fields for log ingestion
+
+        Args:
+            ctx (commands.Context): context of the finished command
+        """
+        if not Log.enabled_for(logging.DEBUG):
+            return
+
+        # Seconds from sending the message to finishing the command
+        latency: float = (datetime.utcnow() - ctx.message.created_at).total_seconds()
+
+        Log.debug('Command %s finished in %.3f s', ctx.command, latency, extra={
+            'guild_id': ctx.guild.id if ctx.guild else None,
+            'command': ctx.command.qualified_name,
+            'latency': latency,
+        }, rate=20)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        """
+        Action that will be invoked when bot joins the guild
+
+        Args:
+            guild (discord.Guild): guild that was joined
+        """
+        Log.info('Joined guild "%s" id:%s', guild.name, guild.id)
+        await resolve_server_prefix(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        """
+        Action that will be invoked when bot leaves or gets removed from the guild
+
+        Args:
+            guild (discord.Guild): guild that was left
+        """
+        Log.info('Removed from guild "%s" id:%s', guild.name, guild.id)
+        evict_server_prefix(guild.id)
+
     @commands.Cog.listener()
     async def on_command_error(self, ctx: commands.Context, error: commands.CommandError) -> None:
         """
@@ -37,21 +87,21 @@ class ListenerCog(commands.Cog):
             ctx (commands.Context): context that invoked error
             error (commands.CommandError): error that was invoked
         """
-        Log.error(f'Command error: "{error}"')
+        Log.error('Command error: "%s"', error)
 
         # Check for error caused by DM bot directly with forbitted command
         if isinstance(error, commands.NoPrivateMessage):
             Log.warning(
-                f'User: "{ctx.author.name}" id:{ctx.author.id} '
-                'attempted to use command'
-                f'"{ctx.command}" in private DM which is not permitted')
+                'User: "%s" id:%s attempted to use command '
+                '"%s" in private DM which is not permitted',
+                ctx.author.name, ctx.author.id, ctx.command)
             await ctx.reply(
                 f'Command "{ctx.command}" cannot be used in a private message. Sorry :(')
 
         if isinstance(error, commands.MissingPermissions):
             Log.warning(
-                f'User: "{ctx.author.name}" id:{ctx.author.id}'
-                f'attempted to use command "{ctx.command}" without needed permissions')
+                'User: "%s" id:%s attempted to use command "%s" without needed permissions',
+                ctx.author.name, ctx.author.id, ctx.command)
             await ctx.reply('You need Admin permissions to use that command')
 
 
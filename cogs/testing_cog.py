@@ -31,11 +31,11 @@ class TestCog(commands.Cog):
         log = self.log
 
         log.debug('Executing echo command')
-        log.debug(f'Context is: {ctx.__dict__}')
-        log.debug(f'Context type is {type(ctx)}')
-        log.debug(f'Context message: {ctx.args}')
+        log.debug('Context is: %s', ctx.__dict__)
+        log.debug('Context type is %s', type(ctx))
+        log.debug('Context message: %s', ctx.args)
 
-        log.debug(f'data is: /{args}/\n data type is{type(args)}')
+        log.debug('data is: /%s/\n data type is%s', args, type(args))
         await ctx.message.reply("Hi <:python:815369954224373760>")
 
 
@@ -0,0 +1,353 @@
+"""
+Opt-in daily agenda digests. Subscribed guilds are grouped by timezone, so at every local midnight
+the digests of the whole timezone are built in one pass from the event indexes
+and posted with limited concurrency
+"""
+
+# Library includes
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, NamedTuple
+import asyncio
+import time
+
+from firebase_admin import firestore
+from google.api_core.exceptions import GoogleAPIError
+
+# Typing info
+from google.cloud.firestore import Client as FirestoreClient
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:
+    # Python 3.8
+    from backports.zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# App includes
+from app.logging.core import Log
+from app.write_behind import write_queue
+from modules.calendar.calendar_handler import events_between
+from modules.calendar.event_index import EventRecord
+
+
+# Maximal number of digests posted at once
+AGENDA_CONCURRENCY: int = 5
+
+# Longest sleep of the scheduler, protects against clock changes
+AGENDA_MAX_SLEEP: float = 3600.0
+
+# Seconds to wait before retrying failed subscription load
+RETRY_DELAY: float = 60.0
+
+
+class AgendaSubscription(NamedTuple):
+    """
+    Agenda settings of single guild
+    """
+    guild_id: int
+    channel_id: int
+    timezone: str
+
+
+@lru_cache(maxsize=None)
+def get_zone(name: str) -> ZoneInfo:
+    """
+    Returns timezone with given IANA name, zones are created once per process
+
+    Args:
+        name (str): IANA timezone name like Europe/Warsaw
+
+    Raises:
+        ValueError: If there is no such timezone
+
+    Returns:
+        ZoneInfo: the timezone
+    """
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError) as exc:
+        raise ValueError(f'Unknown timezone {name}') from exc
+
+
+def next_midnight(zone: ZoneInfo, after: float) -> float:
+    """
+    Returns the first local midnight in the timezone after given time
+
+    Args:
+        zone (ZoneInfo): timezone
+        after (float): POSIX timestamp
+
+    Returns:
+        float: POSIX timestamp of the midnight
+    """
+    local_date = datetime.fromtimestamp(after, tz=zone).date() + timedelta(days=1)
+    return datetime(local_date.year, local_date.month, local_date.day, tzinfo=zone).timestamp()
+
+
+class AgendaScheduler:
+    """
+    Posts daily agenda of subscribed guilds at their local midnight.
+    Guilds are kept grouped by timezone with the next midnight of each timezone,
+    single task sleeps until the earliest one
+
+    Args:
+        concurrency (int, optional): maximal number of digests posted at once.
+            Defaults to AGENDA_CONCURRENCY.
+    """
+
+    def __init__(self, *, concurrency: int = AGENDA_CONCURRENCY) -> None:
+        self.concurrency: int = concurrency
+
+        # timezone name -> {guild id -> AgendaSubscription}
+        self._zones: Dict[str, Dict[int, AgendaSubscription]] = {}
+
+        # timezone name -> POSIX timestamp of its next midnight
+        self._due: Dict[str, float] = {}
+
+        self._post: Callable = None
+        self._runner: asyncio.Task = None
+        self._wakeup: asyncio.Event = None
+        self._semaphore: asyncio.Semaphore = None
+
+    def start(self, post: Callable[[AgendaSubscription, float, List[EventRecord]],
+                                   Awaitable]) -> None:
+        """
+        Loads subscriptions and starts the scheduler
+
+        Args:
+            post (Callable): coroutine function called with
+                (subscription, POSIX timestamp of the day start, events of the day)
+        """
+        if self._runner is not None:
+            return
+
+        self._post = post
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._runner = asyncio.ensure_future(self._run())
+
+    def stop(self) -> None:
+        """
+        Stops the scheduler
+        """
+        if self._runner is None:
+            return
+
+        self._runner.cancel()
+        self._runner = None
+
+    def get(self, guild_id: int) -> AgendaSubscription:
+        """
+        Returns agenda settings of the guild, None if the guild is not subscribed
+        """
+        for subscriptions in self._zones.values():
+            if guild_id in subscriptions:
+                return subscriptions[guild_id]
+
+        return None
+
+    def subscribe(self, guild_id: int, channel_id: int, timezone: str) -> AgendaSubscription:
+        """
+        Turns on daily agenda of the guild or changes its settings
+
+        Args:
+            guild_id (int): guild id
+            channel_id (int): channel where the agenda is posted
+            timezone (str): IANA timezone name
+
+        Raises:
+            ValueError: If there is no such timezone
+
+        Returns:
+            AgendaSubscription: new settings
+        """
+        get_zone(timezone)
+
+        subscription = AgendaSubscription(guild_id, channel_id, timezone)
+        self._add(subscription)
+
+        write_queue.set(_server_config_path(guild_id), {'agenda': {
+            'enabled': True,
+            'channel_id': channel_id,
+            'timezone': timezone,
+        }})
+
+        Log.info('Guild %s subscribed to daily agenda in %s', guild_id, timezone)
+        return subscription
+
+    def unsubscribe(self, guild_id: int) -> bool:
+        """
+        Turns off daily agenda of the guild
+
+        Args:
+            guild_id (int): guild id
+
+        Returns:
+            bool: True if the guild was subscribed
+        """
+        removed: bool = self._remove(guild_id)
+
+        if removed:
+            write_queue.set(_server_config_path(guild_id), {'agenda': {'enabled': False}})
+            Log.info('Guild %s unsubscribed from daily agenda', guild_id)
+
+        return removed
+
+    def __len__(self) -> int:
+        return sum(len(subscriptions) for subscriptions in self._zones.values())
+
+    def _add(self, subscription: AgendaSubscription) -> None:
+        self._remove(subscription.guild_id)
+
+        if subscription.timezone not in self._zones:
+            self._zones[subscription.timezone] = {}
+            self._due[subscription.timezone] = next_midnight(
+                get_zone(subscription.timezone), time.time())
+
+            # New timezone could be due sooner than the timer is set to
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+        self._zones[subscription.timezone][subscription.guild_id] = subscription
+
+    def _remove(self, guild_id: int) -> bool:
+        for timezone, subscriptions in self._zones.items():
+            if subscriptions.pop(guild_id, None) is not None:
+                if not subscriptions:
+                    del self._zones[timezone]
+                    del self._due[timezone]
+                return True
+
+        return False
+
+    async def _run(self) -> None:
+        await self._load()
+
+        # Single runner serves every guild, so no error may stop it
+        while True:
+            try:
+                await self._step()
+            except Exception:  # pylint: disable=broad-except
+                Log.error('Agenda scheduler failed, retrying', exc_info=True)
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def _load(self) -> None:
+        """
+        Loads stored subscriptions, retrying until it succeeds
+        """
+        loop = asyncio.get_event_loop()
+
+        # Make sure subscriptions changed just before the start are already in firestore
+        await write_queue.flush()
+
+        subscriptions: List[AgendaSubscription] = None
+        while subscriptions is None:
+            try:
+                subscriptions = await loop.run_in_executor(None, _load_subscriptions)
+            except GoogleAPIError as exc:
+                Log.error('Could not load agenda subscriptions: %s', exc)
+                await asyncio.sleep(RETRY_DELAY)
+            except Exception:  # pylint: disable=broad-except
+                Log.error('Could not load agenda subscriptions', exc_info=True)
+                await asyncio.sleep(RETRY_DELAY)
+
+        for subscription in subscriptions:
+            # Local subscriptions made during the load are newer
+            if self.get(subscription.guild_id) is None:
+                try:
+                    self._add(subscription)
+                except ValueError as exc:
+                    Log.warning('Agenda of guild %s is disabled: %s', subscription.guild_id, exc)
+
+        Log.info('Loaded %s agenda subscriptions in %s timezones', len(self), len(self._zones))
+
+    async def _step(self) -> None:
+        """
+        Posts agendas of timezones past their midnight or waits for the next midnight
+        """
+        now: float = time.time()
+        due: List[str] = [zone for zone, midnight in self._due.items() if midnight <= now]
+
+        if due:
+            await asyncio.gather(*(self._post_zone(zone) for zone in due))
+            return
+
+        timeout: float = AGENDA_MAX_SLEEP
+        if self._due:
+            timeout = min(timeout, min(self._due.values()) - now)
+
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _post_zone(self, timezone: str) -> None:
+        # Last guild of the timezone could unsubscribe while other agendas were posted
+        day_start: float = self._due.get(timezone)
+        if day_start is None:
+            return
+
+        # The whole timezone shares the day range which is computed once
+        day_end: float = next_midnight(get_zone(timezone), day_start)
+        self._due[timezone] = day_end
+
+        subscriptions: List[AgendaSubscription] = list(self._zones.get(timezone, {}).values())
+
+        async def post(subscription: AgendaSubscription) -> None:
+            async with self._semaphore:
+                try:
+                    records: List[EventRecord] = await events_between(
+                        subscription.guild_id, day_start, day_end)
+                    await self._post(subscription, day_start, records)
+                except Exception as exc:  # pylint: disable=broad-except
+                    Log.error('Agenda of guild %s failed: %s', subscription.guild_id, exc)
+
+        Log.debug('Posting %s agendas for timezone %s', len(subscriptions), timezone)
+        await asyncio.gather(*(post(subscription) for subscription in subscriptions))
+
+
+def _load_subscriptions() -> List[AgendaSubscription]:
+    """
+    Reads agenda settings of all subscribed guilds with collection group query.
+    Malformed settings are skipped. This call is blocking and should be run in executor.
+
+    The query needs single-field index of agenda.enabled with collection group scope
+    on the server-specific collection, it is not created automatically and has to be enabled
+    in the firebase console (Firestore > Indexes > Single field > Add exemption)
+
+    Returns:
+        List[AgendaSubscription]: subscriptions
+    """
+    db_client: FirestoreClient = firestore.client()
+
+    query = db_client.collection_group('server-specific').where(u'agenda.enabled', u'==', True)
+
+    subscriptions: List[AgendaSubscription] = []
+    for document in query.stream():
+        if document.id != 'server-config':
+            continue
+
+        # Path is bot-root/{guild_id}/server-specific/server-config
+        try:
+            agenda: dict = document.to_dict()['agenda']
+            subscription = AgendaSubscription(
+                guild_id=int(document.reference.parent.parent.id),
+                channel_id=int(agenda['channel_id']),
+                timezone=str(agenda['timezone'])
+            )
+        except (AttributeError, KeyError, TypeError, ValueError) as exc:
+            Log.warning('Skipping malformed agenda settings %s: %r', document.reference.path, exc)
+            continue
+
+        subscriptions.append(subscription)
+
+    return subscriptions
+
+
+def _server_config_path(guild_id: int) -> str:
+    return f'bot-root/{guild_id}/server-specific/server-config'
+
+
+# Posts agendas of all guilds
+agenda_scheduler = AgendaScheduler()
@@ -1,7 +1,14 @@
 
 
 # Library includes
-import random
+from collections import deque
+from datetime import datetime, timezone
+from itertools import islice
+from operator import attrgetter
+from typing import IO, Iterator, List
+import asyncio
+import heapq
+import time
 
 from firebase_admin import firestore
 
@@ -10,48 +17,801 @@ from google.cloud.firestore import Client as FirestoreClient
 
 # App includes
 from app.logging.core import Log
+from app.single_flight import SingleFlight
+from app.write_behind import write_queue, MAX_BATCH_SIZE
+from modules.calendar.id_allocator import IdAllocator
+from modules.calendar.ical import read_events, write_calendar, event_to_record
+from modules.calendar.event_index import EventRecord, GuildEventIndex, expand_record
+from modules.calendar.event_index import MAX_EVENT_DURATION
+from modules.calendar.recurrence import Recurrence, FREQUENCIES, occurrences
+from modules.calendar.event_index import record_from_document, record_to_document
+from modules.calendar.reminder_scheduler import ReminderScheduler
 
 
-def load_guild_latest(guild_id: int):
+# Time in seconds after which index of guild that was not used is evicted
+INDEX_IDLE_TIME: float = 1800.0
 
-    # Path to reference to callendar-events collection
-    events_ref_string = f'bot-root/{guild_id}/calendar-events'
+# Number of documents read by single query of calendar export
+EXPORT_PAGE_SIZE: int = 500
+
+# Firestore lookups that are currently in flight, keyed by (lookup name, guild id)
+_lookups = SingleFlight()
+
+# Issues unique calendar event ids
+id_allocator = IdAllocator()
+
+# Loaded event indexes, guild id -> GuildEventIndex
+_indexes: dict = {}
+
+# Fires calendar events of all guilds when their time arrives
+reminder_scheduler = ReminderScheduler()
+
+
+async def get_guild_index(guild_id: int) -> GuildEventIndex:
+    """
+    Coroutine that returns event index of the guild, loading it from firestore on first use.
+    Concurrent calls for the same guild share single firestore query
+
+    Args:
+        guild_id (int): guild id
+
+    Returns:
+        GuildEventIndex: event index
+    """
+    index: GuildEventIndex = _indexes.get(guild_id)
+
+    if index is None:
+        records: List[EventRecord] = await _lookups.do_in_executor(
+            ('index', guild_id), load_guild_events, guild_id)
+
+        # Other caller could have installed the index while this one was waiting
+        index = _indexes.get(guild_id)
+
+        if index is None:
+            index = GuildEventIndex(records)
+            _indexes[guild_id] = index
+
+    index.touch()
+    return index
+
+
+def load_guild_events(guild_id: int) -> List[EventRecord]:
+    """
+    Reads all calendar events of the guild. This call is blocking and should be run in executor
+
+    Args:
+        guild_id (int): guild id
+
+    Returns:
+        List[EventRecord]: events of the guild
+    """
+    Log.debug('Loading calendar events of guild %s', guild_id)
 
     # Firestore client
     db_client: FirestoreClient = firestore.client()
 
     # Collection holding the callendar events
-    events_ref = db_client.collection(events_ref_string)
+    events_ref = db_client.collection(_events_path(guild_id))
+
+    records: List[EventRecord] = [
+        record_from_document(doc.id, doc.to_dict()) for doc in events_ref.stream()]
+
+    Log.debug('Loaded %s calendar events of guild %s', len(records), guild_id)
+    return records
+
+
+async def next_events(guild_id: int, count: int, after: float = None) -> List[EventRecord]:
+    """
+    Coroutine that returns upcoming events of the guild
+
+    Args:
+        guild_id (int): guild id
+        count (int): maximal number of events
+        after (float, optional): POSIX timestamp, defaults to now
+
+    Returns:
+        List[EventRecord]: events sorted by time
+    """
+    index: GuildEventIndex = await get_guild_index(guild_id)
+    return index.next_events(time.time() if after is None else after, count)
+
+
+async def events_between(guild_id: int, start: float, end: float) -> List[EventRecord]:
+    """
+    Coroutine that returns events of the guild starting in the range [start, end).
+    Loaded guilds are served from memory, otherwise only events starting
+    in the range and the recurring events are read from firestore
+
+    Args:
+        guild_id (int): guild id
+        start (float): POSIX timestamp
+        end (float): POSIX timestamp
+
+    Returns:
+        List[EventRecord]: events sorted by time
+    """
+    index: GuildEventIndex = _loaded_index(guild_id)
+
+    if index is None:
+        return await _load_starting(guild_id, start, end)
+
+    return index.between(start, end)
+
+
+async def events_overlapping(guild_id: int, start: float, end: float) -> List[EventRecord]:
+    """
+    Coroutine that returns events of the guild that overlap the range [start, end).
+    Loaded guilds are served from memory, otherwise only events starting
+    in the range extended by MAX_EVENT_DURATION are read from firestore
+
+    Args:
+        guild_id (int): guild id
+        start (float): POSIX timestamp
+        end (float): POSIX timestamp
+
+    Returns:
+        List[EventRecord]: events sorted by start time
+    """
+    index: GuildEventIndex = _loaded_index(guild_id)
+
+    if index is None:
+        return await _load_overlapping(guild_id, start, end)
+
+    return index.overlapping(start, end)
+
+
+async def events_happening(guild_id: int, moment: float = None) -> List[EventRecord]:
+    """
+    Coroutine that returns events of the guild that are in progress
+
+    Args:
+        guild_id (int): guild id
+        moment (float, optional): POSIX timestamp, defaults to now
+
+    Returns:
+        List[EventRecord]: events sorted by start time
+    """
+    moment = time.time() if moment is None else moment
+
+    records: List[EventRecord] = await events_overlapping(guild_id, moment, moment + 1.0)
+    return [record for record in records if record.time <= moment < record.end]
+
+
+async def find_conflicts(guild_id: int, event_time: float, duration: float,
+                         ignored_id: int = None) -> List[EventRecord]:
+    """
+    Coroutine that returns events overlapping the planned event, answered from the guild index
+
+    Args:
+        guild_id (int): guild id
+        event_time (float): POSIX timestamp of the planned event
+        duration (float): duration of the planned event in seconds
+        ignored_id (int, optional): id of event that is not a conflict, used when editing
+
+    Returns:
+        List[EventRecord]: conflicting events sorted by start time
+    """
+    index: GuildEventIndex = await get_guild_index(guild_id)
+
+    # Planned event without duration is treated as lasting one second
+    end: float = event_time + max(duration, 1.0)
+
+    return [
+        record for record in index.overlapping(event_time, end) if record.id != ignored_id]
+
+
+def _loaded_index(guild_id: int) -> GuildEventIndex:
+    # Index of the guild if it is already in memory
+    index: GuildEventIndex = _indexes.get(guild_id)
+
+    if index is not None:
+        index.touch()
+
+    return index
+
+
+async def _load_starting(guild_id: int, start: float, end: float) -> List[EventRecord]:
+    loop = asyncio.get_event_loop()
+    singles, rules = await asyncio.gather(
+        loop.run_in_executor(None, load_events_starting, guild_id, start, end),
+        loop.run_in_executor(None, load_guild_rules, guild_id)
+    )
+
+    streams: list = [singles] + [expand_record(rule, start, end) for rule in rules]
+
+    return list(heapq.merge(*streams, key=attrgetter('time')))
+
+
+async def _load_overlapping(guild_id: int, start: float, end: float) -> List[EventRecord]:
+    loop = asyncio.get_event_loop()
+    singles, rules = await asyncio.gather(
+        loop.run_in_executor(None, load_events_starting, guild_id, start - MAX_EVENT_DURATION, end),
+        loop.run_in_executor(None, load_guild_rules, guild_id)
+    )
+
+    streams: list = [singles] + [
+        expand_record(rule, start - rule.duration, end) for rule in rules]
+
+    return [
+        record for record in heapq.merge(*streams, key=attrgetter('time'))
+        if record.overlaps(start, end)]
+
+
+def load_events_starting(guild_id: int, start: float, end: float) -> List[EventRecord]:
+    """
+    Reads single events starting in the range [start, end) with bounded range query.
+    This call is blocking and should be run in executor
+
+    Args:
+        guild_id (int): guild id
+        start (float): POSIX timestamp
+        end (float): POSIX timestamp
+
+    Returns:
+        List[EventRecord]: events sorted by time
+    """
+    db_client: FirestoreClient = firestore.client()
+
+    query = db_client.collection(_events_path(guild_id)).where(
+        u'time', u'>=', datetime.fromtimestamp(start, tz=timezone.utc)).where(
+        u'time', u'<', datetime.fromtimestamp(end, tz=timezone.utc)).order_by(u'time')
+
+    # Recurring events are expanded from their rules
+    return [
+        record for record in (
+            record_from_document(doc.id, doc.to_dict()) for doc in query.stream())
+        if record.recurrence is None]
+
+
+async def add_event(guild_id: int, event_time: float, description: str,
+                    channel_id: int = None, duration: float = 0.0) -> EventRecord:
+    """
+    Coroutine that creates new calendar event
+
+    Args:
+        guild_id (int): guild id
+        event_time (float): POSIX timestamp of the event
+        description (str): event description
+        channel_id (int, optional): channel where the event was created
+        duration (float, optional): duration of the event in seconds. Defaults to 0.0.
+
+    Raises:
+        ValueError: If the duration is negative or longer than MAX_EVENT_DURATION
+
+    Returns:
+        EventRecord: created event
+    """
+    _check_duration(duration)
+
+    index: GuildEventIndex = await get_guild_index(guild_id)
+    event_id: int = await next_uid(guild_id)
+
+    record = EventRecord(
+        id=event_id,
+        time=event_time,
+        description=description,
+        channel_id=channel_id,
+        doc_id=str(event_id),
+        duration=duration
+    )
+
+    index.add(record)
+    write_queue.set(_event_path(guild_id, record), record_to_document(record))
+    reminder_scheduler.schedule(guild_id, record)
+
+    Log.info('Added calendar event %s in guild %s', event_id, guild_id)
+    return record
+
+
+async def edit_event(guild_id: int, event_id: int, **changes) -> EventRecord:
+    """
+    Coroutine that changes fields of existing calendar event
+
+    Args:
+        guild_id (int): guild id
+        event_id (int): event id
+        **changes: new values of EventRecord fields
+
+    Raises:
+        ValueError: If the duration is negative or longer than MAX_EVENT_DURATION
+
+    Returns:
+        EventRecord: updated event, None if there is no such event
+    """
+    if 'duration' in changes:
+        _check_duration(changes['duration'])
+
+    index: GuildEventIndex = await get_guild_index(guild_id)
+    record: EventRecord = index.get(event_id)
+
+    if record is None:
+        return None
+
+    record = record._replace(**changes)
+
+    index.add(record)
+    write_queue.set(_event_path(guild_id, record), record_to_document(record))
+    reminder_scheduler.schedule(guild_id, record)
+
+    Log.info('Edited calendar event %s in guild %s', event_id, guild_id)
+    return record
+
+
+async def delete_event(guild_id: int, event_id: int) -> EventRecord:
+    """
+    Coroutine that deletes calendar event
+
+    Args:
+        guild_id (int): guild id
+        event_id (int): event id
+
+    Returns:
+        EventRecord: deleted event, None if there was no such event
+    """
+    index: GuildEventIndex = await get_guild_index(guild_id)
+    record: EventRecord = index.remove(event_id)
+
+    if record is None:
+        return None
+
+    write_queue.delete(_event_path(guild_id, record))
+    reminder_scheduler.cancel(guild_id, event_id)
+
+    Log.info('Deleted calendar event %s in guild %s', event_id, guild_id)
+    return record
+
+
+async def fetch_events_page(guild_id: int, cursor=None, page_size: int = 10,
+                            after: float = None) -> tuple:
+    """
+    Coroutine that retrieves one page of upcoming events ordered by time straight from firestore,
+    so listing does not need the whole calendar
+
+    Args:
+        guild_id (int): guild id
+        cursor (DocumentSnapshot, optional): last document of the previous page
+        page_size (int, optional): number of events on the page. Defaults to 10.
+        after (float, optional): POSIX timestamp of the first listed event, defaults to now
+
+    Returns:
+        tuple: (events on the page, cursor of the next page or None if this is the last page)
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        None, load_events_page, guild_id, cursor, page_size,
+        time.time() if after is None else after)
+
+
+def load_events_page(guild_id: int, cursor, page_size: int, after: float) -> tuple:
+    """
+    Reads one page of events using limit and start_after cursor.
+    This call is blocking and should be run in executor
+
+    Args:
+        guild_id (int): guild id
+        cursor (DocumentSnapshot): last document of the previous page or None
+        page_size (int): number of events on the page
+        after (float): POSIX timestamp of the first listed event
+
+    Returns:
+        tuple: (events on the page, cursor of the next page or None if this is the last page)
+    """
+    db_client: FirestoreClient = firestore.client()
+
+    query = db_client.collection(_events_path(guild_id)).where(
+        u'time', u'>=', datetime.fromtimestamp(after, tz=timezone.utc)).order_by(u'time')
+
+    if cursor is not None:
+        query = query.start_after(cursor)
+
+    # One extra document tells whether there is a next page
+    snapshots: list = list(query.limit(page_size + 1).stream())
+
+    records: List[EventRecord] = [
+        record_from_document(doc.id, doc.to_dict()) for doc in snapshots[:page_size]]
+    next_cursor = snapshots[page_size - 1] if len(snapshots) > page_size else None
 
-    # Retriving and sorting all callendar events
-    query = events_ref.order_by(
-        u'time', direction='ASCENDING').stream()
+    return records, next_cursor
 
-    for doc in query:
-        Log.warning(f'{doc.id} => {doc.to_dict()}')
 
+def load_guild_rules(guild_id: int) -> List[EventRecord]:
+    """
+    Reads recurring events of the guild. This call is blocking and should be run in executor
 
-def next_uid(guild_id: int):
+    Args:
+        guild_id (int): guild id
 
-    Log.debug(f'Genereting new uid for callendar event in guild {guild_id}')
-    # Initialize random seed
-    random.seed()
+    Returns:
+        List[EventRecord]: recurring events
+    """
+    db_client: FirestoreClient = firestore.client()
+
+    query = db_client.collection(_events_path(guild_id)).where(u'recurring', u'==', True)
+
+    return [record_from_document(doc.id, doc.to_dict()) for doc in query.stream()]
+
+
+class EventPager:
+    """
+    Streams upcoming events of the guild page by page.
+    Single events are fetched from firestore with cursor queries only when the page needs them,
+    occurrences of recurring events are generated lazily from their rules
+
+    Args:
+        guild_id (int): guild id
+        page_size (int, optional): number of events on the page. Defaults to 10.
+    """
+
+    def __init__(self, guild_id: int, page_size: int = 10) -> None:
+        self.guild_id: int = guild_id
+        self.page_size: int = page_size
+        self._after: float = time.time()
+
+        # Fetched single events that were not returned yet
+        self._singles: deque = deque()
+        self._cursor = None
+        self._singles_exhausted: bool = False
+
+        # Occurrences of recurring events merged by time, created with the first page
+        self._occurrences: Iterator[EventRecord] = None
+        self._next_occurrence: EventRecord = None
+
+    @property
+    def has_more(self) -> bool:
+        """
+        False if it is known that there are no more events
+        """
+        return (bool(self._singles) or not self._singles_exhausted
+                or self._next_occurrence is not None)
+
+    async def next_page(self) -> List[EventRecord]:
+        """
+        Coroutine that returns the next page of events
+
+        Returns:
+            List[EventRecord]: events sorted by time, empty if there are no more events
+        """
+        if self._occurrences is None:
+            loop = asyncio.get_event_loop()
+            rules: List[EventRecord] = await loop.run_in_executor(
+                None, load_guild_rules, self.guild_id)
+
+            self._occurrences = heapq.merge(
+                *(expand_record(rule, self._after) for rule in rules), key=attrgetter('time'))
+            self._next_occurrence = next(self._occurrences, None)
 
-    # Random number from 1000 to 9999 inclusive
-    rand_number: int = random.randrange(1000, 10000)
+        page: List[EventRecord] = []
 
-    # The following part checks if the random id is unique
-    db_client: FirestoreClient = firestore.client()  # The firestore client
-    # String path to events
-    path_to_events: str = f'bot-root/{guild_id}/calendar-events'
-    coll_ref = db_client.collection(path_to_events)  # Collection reference
+        while len(page) < self.page_size:
+            # Single events are needed to know which event comes next
+            if not self._singles and not self._singles_exhausted:
+                records, self._cursor = await fetch_events_page(
+                    self.guild_id, self._cursor, self.page_size, self._after)
 
-    Log.debug('Accesing firestore to verify uid')
-    query = coll_ref.where(u'id', u'==', rand_number).get()
+                # Recurring events are generated from rules instead
+                self._singles.extend(
+                    record for record in records if record.recurrence is None)
+                self._singles_exhausted = self._cursor is None
+                continue
 
-    # If it's unique already
-    if not query:
-        Log.debug(f'Generated {rand_number}')
-        return rand_number
+            single: EventRecord = self._singles[0] if self._singles else None
+            occurrence: EventRecord = self._next_occurrence
+
+            if single is None and occurrence is None:
+                break
+
+            if occurrence is None or (single is not None and single.time <= occurrence.time):
+                page.append(self._singles.popleft())
+            else:
+                page.append(occurrence)
+                self._next_occurrence = next(self._occurrences, None)
+
+        return page
+
+
+async def set_recurrence(guild_id: int, event_id: int, freq: str,
+                         interval: int = 1) -> EventRecord:
+    """
+    Coroutine that makes the event recurring or stops its recurrence.
+    Changing the rule of recurring event keeps its until and skipped occurrences
+
+    Args:
+        guild_id (int): guild id
+        event_id (int): event id
+        freq (str): one of FREQUENCIES, None stops the recurrence
+        interval (int, optional): number of frequency units between occurrences. Defaults to 1.
+
+    Raises:
+        ValueError: If the frequency is not supported
+
+    Returns:
+        EventRecord: updated event, None if there is no such event
+    """
+    if freq is None:
+        return await edit_event(guild_id, event_id, recurrence=None)
+
+    if freq not in FREQUENCIES:
+        raise ValueError(f'Unsupported frequency {freq}')
+
+    index: GuildEventIndex = await get_guild_index(guild_id)
+    record: EventRecord = index.get(event_id)
+
+    if record is None:
+        return None
+
+    if record.recurrence is None:
+        recurrence: Recurrence = Recurrence(freq=freq, interval=max(interval, 1))
     else:
-        return next_uid(guild_id)
+        recurrence = record.recurrence._replace(freq=freq, interval=max(interval, 1))
+
+    return await edit_event(guild_id, event_id, recurrence=recurrence)
+
+
+async def skip_occurrence(guild_id: int, event_id: int, occurrence: float) -> EventRecord:
+    """
+    Coroutine that adds exception to recurring event so given occurrence does not happen
+
+    Args:
+        guild_id (int): guild id
+        event_id (int): event id
+        occurrence (float): POSIX timestamp of the skipped occurrence
+
+    Raises:
+        ValueError: If the event does not occur at given time
+
+    Returns:
+        EventRecord: updated event, None if there is no such recurring event
+    """
+    index: GuildEventIndex = await get_guild_index(guild_id)
+    record: EventRecord = index.get(event_id)
+
+    if record is None or record.recurrence is None:
+        return None
+
+    # Skipping the occurrence again changes nothing
+    if occurrence in record.recurrence.exceptions:
+        return record
+
+    if next(occurrences(record.time, record.recurrence, occurrence), None) != occurrence:
+        raise ValueError(f'Event {event_id} does not occur at {occurrence}')
+
+    recurrence: Recurrence = record.recurrence._replace(
+        exceptions=record.recurrence.exceptions | {occurrence})
+
+    return await edit_event(guild_id, event_id, recurrence=recurrence)
+
+
+def export_events(guild_id: int, output: IO[str]) -> int:
+    """
+    Writes all events of the guild to iCalendar file. Events are read with paginated queries
+    and written as they arrive, so neither the calendar nor the file is held in memory.
+    This call is blocking and should be run in executor
+
+    Args:
+        guild_id (int): guild id
+        output (IO[str]): text file opened for writing
+
+    Returns:
+        int: number of exported events
+    """
+    count: int = write_calendar(output, _stream_events(guild_id), guild_id)
+
+    Log.info('Exported %s calendar events of guild %s', count, guild_id)
+    return count
+
+
+def _stream_events(guild_id: int) -> Iterator[EventRecord]:
+    # Lazily reads events ordered by time page by page
+    db_client: FirestoreClient = firestore.client()
+    query = db_client.collection(_events_path(guild_id)).order_by(u'time')
+    cursor = None
+
+    while True:
+        page_query = query if cursor is None else query.start_after(cursor)
+        snapshots: list = list(page_query.limit(EXPORT_PAGE_SIZE).stream())
+
+        for doc in snapshots:
+            yield record_from_document(doc.id, doc.to_dict())
+
+        if len(snapshots) < EXPORT_PAGE_SIZE:
+            return
+
+        cursor = snapshots[-1]
+
+
+async def import_events(guild_id: int, source: IO[str], channel_id: int) -> tuple:
+    """
+    Coroutine that imports events from iCalendar file. The file is parsed lazily,
+    each chunk of MAX_BATCH_SIZE events gets ids with single reservation
+    and is written with single firestore batch
+
+    Args:
+        guild_id (int): guild id
+        source (IO[str]): text file opened for reading
+        channel_id (int): channel where imported events are announced
+
+    Returns:
+        tuple: (number of imported events, number of skipped invalid events)
+    """
+    loop = asyncio.get_event_loop()
+    events: Iterator[dict] = read_events(source)
+
+    imported: int = 0
+    skipped: int = 0
+
+    while True:
+        # Reading the file is blocking as well
+        chunk: List[dict] = await loop.run_in_executor(
+            None, lambda: list(islice(events, MAX_BATCH_SIZE)))
+
+        if not chunk:
+            break
+
+        # Invalid events are dropped before the ids are reserved
+        records: List[EventRecord] = []
+        for event in chunk:
+            try:
+                records.append(event_to_record(event, None, channel_id))
+            except ValueError as exc:
+                Log.debug('Skipping imported event in guild %s: %s', guild_id, exc, rate=1)
+                skipped += 1
+
+        if not records:
+            continue
+
+        ids: range = await id_allocator.reserve(guild_id, len(records))
+        records = [
+            record._replace(id=event_id, doc_id=str(event_id))
+            for event_id, record in zip(ids, records)]
+
+        await loop.run_in_executor(None, _commit_records, guild_id, records)
+        imported += len(records)
+
+        # Loaded index is kept in sync, otherwise the events are read with the index
+        index: GuildEventIndex = _indexes.get(guild_id)
+        for record in records:
+            if index is not None:
+                index.add(record)
+            reminder_scheduler.schedule(guild_id, record)
+
+    Log.info('Imported %s calendar events to guild %s, skipped %s', imported, guild_id, skipped)
+    return imported, skipped
+
+
+def _commit_records(guild_id: int, records: List[EventRecord]) -> None:
+    # Writes at most MAX_BATCH_SIZE new events with single batch
+    db_client: FirestoreClient = firestore.client()
+    batch = db_client.batch()
+
+    for record in records:
+        batch.set(db_client.document(_event_path(guild_id, record)), record_to_document(record))
+
+    batch.commit()
+
+
+def evict_idle_indexes(max_idle: float = INDEX_IDLE_TIME) -> int:
+    """
+    Drops indexes of guilds that were not used for given time
+
+    Args:
+        max_idle (float, optional): idle time in seconds. Defaults to INDEX_IDLE_TIME.
+
+    Returns:
+        int: number of evicted indexes
+    """
+    deadline: float = time.monotonic() - max_idle
+    idle_ids: list = [
+        guild_id for guild_id, index in _indexes.items() if index.last_access < deadline]
+
+    for guild_id in idle_ids:
+        del _indexes[guild_id]
+
+    if idle_ids:
+        Log.debug('Evicted %s idle calendar indexes', len(idle_ids))
+
+    return len(idle_ids)
+
+
+async def next_uid(guild_id: int) -> int:
+    """
+    Coroutine that returns unique id for new calendar event in the guild
+
+    Args:
+        guild_id (int): guild id
+
+    Returns:
+        int: event id
+    """
+    event_id: int = await id_allocator.next_id(guild_id)
+    Log.debug('Generated uid %s for callendar event in guild %s', event_id, guild_id)
+    return event_id
+
+
+def subscribe_reminder(guild_id: int, event_id: int, user_id: int) -> None:
+    """
+    Opts the user in to direct message when the event starts
+
+    Args:
+        guild_id (int): guild id
+        event_id (int): event id
+        user_id (int): user id
+    """
+    write_queue.set(_reminder_path(guild_id, event_id, user_id), {
+        'event_id': event_id,
+        'user_id': user_id,
+    })
+
+
+def unsubscribe_reminder(guild_id: int, event_id: int, user_id: int) -> None:
+    """
+    Opts the user out of direct message when the event starts
+
+    Args:
+        guild_id (int): guild id
+        event_id (int): event id
+        user_id (int): user id
+    """
+    write_queue.delete(_reminder_path(guild_id, event_id, user_id))
+
+
+async def reminder_subscribers(guild_id: int, event_id: int) -> List[int]:
+    """
+    Coroutine that returns ids of users that want direct message when the event starts
+
+    Args:
+        guild_id (int): guild id
+        event_id (int): event id
+
+    Returns:
+        List[int]: user ids
+    """
+    # Subscriptions made just before the event are still pending
+    await write_queue.flush()
+
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, load_reminder_subscribers, guild_id, event_id)
+
+
+def load_reminder_subscribers(guild_id: int, event_id: int) -> List[int]:
+    """
+    Reads ids of users subscribed to the event. This call is blocking and should be run in executor
+
+    Args:
+        guild_id (int): guild id
+        event_id (int): event id
+
+    Returns:
+        List[int]: user ids
+    """
+    db_client: FirestoreClient = firestore.client()
+
+    query = db_client.collection(f'bot-root/{guild_id}/calendar-reminders').where(
+        u'event_id', u'==', event_id)
+
+    return [doc.get('user_id') for doc in query.stream()]
+
+
+def _check_duration(duration: float) -> None:
+    if not 0 <= duration <= MAX_EVENT_DURATION:
+        raise ValueError(f'Event duration has to be between 0 and {MAX_EVENT_DURATION} seconds')
+
+
+def _reminder_path(guild_id: int, event_id: int, user_id: int) -> str:
+    """
+    Returns path to the document of user subscription to the event reminder
+    """
+    return f'bot-root/{guild_id}/calendar-reminders/{event_id}-{user_id}'
+
+
+def _events_path(guild_id: int) -> str:
+    """
+    Returns path to the collection holding calendar events of the guild
+    """
+    return f'bot-root/{guild_id}/calendar-events'
+
+
+def _event_path(guild_id: int, record: EventRecord) -> str:
+    """
+    Returns path to the document of the calendar event
+    """
+    return f'{_events_path(guild_id)}/{record.doc_id}'
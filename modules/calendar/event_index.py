@@ -0,0 +1,329 @@
+"""
+In-memory index of calendar events of single guild kept sorted by event time.
+Recurring events are kept as rules and their occurrences are generated only for queried range.
+Overlap queries use the sorted starts bounded by the longest event duration
+"""
+
+# Library includes
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from itertools import islice
+from operator import attrgetter
+from typing import Dict, Iterator, List, NamedTuple
+import heapq
+import time
+
+# App includes
+from modules.calendar.recurrence import Recurrence, occurrences
+from modules.calendar.recurrence import recurrence_from_document, recurrence_to_document
+
+
+# Longest allowed event duration in seconds, bounds range queries on event start
+MAX_EVENT_DURATION: float = 7 * 86400.0
+
+# Stored as the end of recurring events without until, so range queries match them as well
+ENDLESS_RECURRENCE: datetime = datetime(9999, 12, 31, tzinfo=timezone.utc)
+
+
+class EventRecord(NamedTuple):
+    """
+    Compact representation of calendar event, times are POSIX timestamps.
+    Time of recurring event is the time of its first occurrence,
+    every occurrence lasts the same duration in seconds
+    """
+    id: int
+    time: float
+    description: str
+    channel_id: int = None
+    doc_id: str = None
+    recurrence: Recurrence = None
+    duration: float = 0.0
+
+    @property
+    def end(self) -> float:
+        """
+        POSIX timestamp of the event end
+        """
+        return self.time + self.duration
+
+    def overlaps(self, start: float, end: float) -> bool:
+        """
+        Checks whether the event overlaps the range [start, end).
+        Event without duration overlaps the range if it starts in it
+
+        Args:
+            start (float): POSIX timestamp
+            end (float): POSIX timestamp
+
+        Returns:
+            bool: True if the event overlaps the range
+        """
+        return self.time < end and (self.end > start or self.time >= start)
+
+
+def record_from_document(doc_id: str, document: dict) -> EventRecord:
+    """
+    Creates event record from firestore document
+
+    Args:
+        doc_id (str): id of the firestore document
+        document (dict): document fields
+
+    Returns:
+        EventRecord: event record
+    """
+    start: float = document['time'].timestamp()
+    end = document.get('end')
+
+    return EventRecord(
+        id=document['id'],
+        time=start,
+        description=document.get('description', ''),
+        channel_id=document.get('channel_id'),
+        doc_id=doc_id,
+        recurrence=recurrence_from_document(document.get('recurrence')),
+        duration=0.0 if end is None else max(end.timestamp() - start, 0.0)
+    )
+
+
+def record_to_document(record: EventRecord) -> dict:
+    """
+    Converts event record to firestore document fields
+
+    Args:
+        record (EventRecord): event record
+
+    Returns:
+        dict: document fields
+    """
+    return {
+        'id': record.id,
+        'time': datetime.fromtimestamp(record.time, tz=timezone.utc),
+        'end': datetime.fromtimestamp(record.end, tz=timezone.utc),
+        'description': record.description,
+        'channel_id': record.channel_id,
+        'recurring': record.recurrence is not None,
+        'recurrence': recurrence_to_document(record.recurrence),
+        'recurrence_end': _recurrence_end(record.recurrence),
+    }
+
+
+def _recurrence_end(recurrence: Recurrence) -> datetime:
+    """
+    Returns the time of the last possible occurrence, used to query only active recurring events
+
+    Args:
+        recurrence (Recurrence): recurrence rule, may be None
+
+    Returns:
+        datetime: until of the rule, ENDLESS_RECURRENCE if the rule has none,
+                  None if the event does not recur
+    """
+    if recurrence is None:
+        return None
+
+    if recurrence.until is None:
+        return ENDLESS_RECURRENCE
+
+    return datetime.fromtimestamp(recurrence.until, tz=timezone.utc)
+
+
+def expand_record(record: EventRecord, start: float, end: float = None) -> Iterator[EventRecord]:
+    """
+    Lazily generates occurrences of the event in the range [start, end).
+    Single event has at most one occurrence, occurrence of recurring event
+    is the record with time set to the occurrence time
+
+    Args:
+        record (EventRecord): event record
+        start (float): POSIX timestamp
+        end (float, optional): POSIX timestamp, None means no upper bound
+
+    Yields:
+        EventRecord: occurrences in ascending order
+    """
+    if record.recurrence is None:
+        if record.time >= start and (end is None or record.time < end):
+            yield record
+        return
+
+    for occurrence in occurrences(record.time, record.recurrence, start, end):
+        yield record._replace(time=occurrence)
+
+
+class GuildEventIndex:
+    """
+    Events of single guild sorted by time. Keys of single events are (time, id) pairs
+    so they can be bisected, recurring events are kept aside and expanded on demand.
+    Sorted durations of single events bound how far before the range overlapping events can start
+
+    Args:
+        records (List[EventRecord]): initial events
+    """
+
+    def __init__(self, records: List[EventRecord]) -> None:
+        self._records: Dict[int, EventRecord] = {
+            record.id: record for record in records}
+        self._keys: List[tuple] = sorted(
+            (record.time, record.id) for record in self._records.values()
+            if record.recurrence is None)
+        self._durations: List[float] = sorted(
+            self._records[event_id].duration for _, event_id in self._keys)
+
+        # Recurring events, event id -> EventRecord
+        self._rules: Dict[int, EventRecord] = {
+            record.id: record for record in self._records.values()
+            if record.recurrence is not None}
+
+        # Monotonic time of the last access, used to evict idle guilds
+        self.last_access: float = time.monotonic()
+
+    def add(self, record: EventRecord) -> None:
+        """
+        Inserts the event or replaces event with the same id
+
+        Args:
+            record (EventRecord): event record
+        """
+        self.remove(record.id)
+        self._records[record.id] = record
+
+        if record.recurrence is None:
+            insort(self._keys, (record.time, record.id))
+            insort(self._durations, record.duration)
+        else:
+            self._rules[record.id] = record
+
+    def remove(self, event_id: int) -> EventRecord:
+        """
+        Removes the event
+
+        Args:
+            event_id (int): event id
+
+        Returns:
+            EventRecord: removed event, None if there was no such event
+        """
+        record: EventRecord = self._records.pop(event_id, None)
+
+        if record is None:
+            return None
+
+        if record.recurrence is None:
+            position: int = bisect_left(self._keys, (record.time, record.id))
+            del self._keys[position]
+            del self._durations[bisect_left(self._durations, record.duration)]
+        else:
+            del self._rules[event_id]
+
+        return record
+
+    def get(self, event_id: int) -> EventRecord:
+        """
+        Returns the event with given id or None
+        """
+        return self._records.get(event_id)
+
+    def next_events(self, after: float, count: int) -> List[EventRecord]:
+        """
+        Returns events and occurrences of recurring events that start at or after given time
+
+        Args:
+            after (float): POSIX timestamp
+            count (int): maximal number of events
+
+        Returns:
+            List[EventRecord]: events sorted by time
+        """
+        start: int = bisect_left(self._keys, (after,))
+
+        if not self._rules:
+            return [self._records[event_id] for _, event_id in self._keys[start:start + count]]
+
+        singles: Iterator[EventRecord] = (
+            self._records[self._keys[position][1]] for position in range(start, len(self._keys)))
+
+        return list(islice(self._merge(singles, after), count))
+
+    def between(self, start: float, end: float) -> List[EventRecord]:
+        """
+        Returns events and occurrences of recurring events that start in the range [start, end)
+
+        Args:
+            start (float): POSIX timestamp
+            end (float): POSIX timestamp
+
+        Returns:
+            List[EventRecord]: events sorted by time
+        """
+        low: int = bisect_left(self._keys, (start,))
+        high: int = bisect_left(self._keys, (end,), low)
+        singles: List[EventRecord] = [
+            self._records[event_id] for _, event_id in self._keys[low:high]]
+
+        if not self._rules:
+            return singles
+
+        return list(self._merge(iter(singles), start, end))
+
+    def overlapping(self, start: float, end: float) -> List[EventRecord]:
+        """
+        Returns events and occurrences of recurring events that overlap the range [start, end)
+
+        Args:
+            start (float): POSIX timestamp
+            end (float): POSIX timestamp
+
+        Returns:
+            List[EventRecord]: events sorted by start time
+        """
+        # No single event starting before this time can reach the range
+        longest: float = self._durations[-1] if self._durations else 0.0
+        low: int = bisect_left(self._keys, (start - longest,))
+        high: int = bisect_left(self._keys, (end,), low)
+
+        singles: List[EventRecord] = [
+            self._records[event_id] for _, event_id in self._keys[low:high]]
+        streams: list = [singles] + [
+            expand_record(rule, start - rule.duration, end) for rule in self._rules.values()]
+
+        return [
+            record for record in heapq.merge(*streams, key=attrgetter('time'))
+            if record.overlaps(start, end)]
+
+    def happening_at(self, moment: float) -> List[EventRecord]:
+        """
+        Returns events that have started and not yet ended at given time
+
+        Args:
+            moment (float): POSIX timestamp
+
+        Returns:
+            List[EventRecord]: events sorted by start time
+        """
+        # Any range starting at the moment contains the candidates, they are filtered exactly
+        return [
+            record for record in self.overlapping(moment, moment + 1.0)
+            if record.time <= moment < record.end]
+
+    def rules(self) -> List[EventRecord]:
+        """
+        Returns recurring events
+        """
+        return list(self._rules.values())
+
+    def touch(self) -> None:
+        """
+        Marks the index as recently used
+        """
+        self.last_access = time.monotonic()
+
+    def _merge(self, singles: Iterator[EventRecord], start: float,
+               end: float = None) -> Iterator[EventRecord]:
+        # Lazily merges single events with occurrences of every recurring event
+        streams: list = [singles] + [
+            expand_record(rule, start, end) for rule in self._rules.values()]
+        return heapq.merge(*streams, key=attrgetter('time'))
+
+    def __len__(self) -> int:
+        return len(self._records)
@@ -0,0 +1,339 @@
+"""
+Streaming conversion between calendar events and iCalendar (RFC 5545) files.
+Events are read and written one by one so the whole file never has to be kept in memory
+"""
+
+# Library includes
+from datetime import datetime, timezone
+from itertools import islice
+from typing import IO, Iterable, Iterator
+import re
+
+# App includes
+from modules.calendar.event_index import EventRecord, MAX_EVENT_DURATION
+from modules.calendar.recurrence import Recurrence, FREQUENCIES, occurrences
+
+
+# Content lines longer than this many octets are folded
+MAX_LINE_OCTETS: int = 75
+
+# Format of UTC date-time values
+ICAL_TIME_FORMAT: str = '%Y%m%dT%H%M%SZ'
+
+# DURATION value like P1DT2H30M, weeks are matched separately
+DURATION_PATTERN = re.compile(
+    r'^\+?P(?:(?P<weeks>\d+)W)?(?:(?P<days>\d+)D)?'
+    r'(?:T(?:(?P<hours>\d+)H)?(?:(?P<minutes>\d+)M)?(?:(?P<seconds>\d+)S)?)?$')
+
+# RRULE parts that are understood, rules with any other part are rejected
+SUPPORTED_RRULE_PARTS: frozenset = frozenset(
+    ('FREQ', 'INTERVAL', 'UNTIL', 'COUNT', 'WKST', 'BYDAY', 'BYMONTHDAY'))
+
+# iCalendar weekday names in the order of datetime.weekday()
+WEEKDAYS: tuple = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+# Identifier of the product that created the exported file
+PRODUCT_ID: str = '-//DzwoneczekBOT//Calendar//EN'
+
+
+def write_calendar(output: IO[str], records: Iterable[EventRecord], guild_id: int) -> int:
+    """
+    Writes events as iCalendar file, records can be a lazy iterable
+
+    Args:
+        output (IO[str]): text file opened for writing
+        records (Iterable[EventRecord]): events to be written
+        guild_id (int): guild id used in event UIDs
+
+    Returns:
+        int: number of written events
+    """
+    _write_line(output, 'BEGIN:VCALENDAR')
+    _write_line(output, 'VERSION:2.0')
+    _write_line(output, f'PRODID:{PRODUCT_ID}')
+
+    stamp: str = _format_time(datetime.now(tz=timezone.utc).timestamp())
+    count: int = 0
+
+    for record in records:
+        _write_line(output, 'BEGIN:VEVENT')
+        _write_line(output, f'UID:{record.id}-{guild_id}@dzwoneczek')
+        _write_line(output, f'DTSTAMP:{stamp}')
+        _write_line(output, f'DTSTART:{_format_time(record.time)}')
+
+        if record.duration > 0:
+            _write_line(output, f'DTEND:{_format_time(record.end)}')
+
+        _write_line(output, f'SUMMARY:{_escape(record.description)}')
+
+        if record.recurrence is not None:
+            _write_line(output, f'RRULE:{_format_rrule(record.recurrence)}')
+
+            for exception in sorted(record.recurrence.exceptions):
+                _write_line(output, f'EXDATE:{_format_time(exception)}')
+
+        _write_line(output, 'END:VEVENT')
+        count += 1
+
+    _write_line(output, 'END:VCALENDAR')
+    return count
+
+
+def read_events(source: IO[str]) -> Iterator[dict]:
+    """
+    Lazily parses VEVENT components of iCalendar file
+
+    Args:
+        source (IO[str]): text file opened for reading
+
+    Yields:
+        dict: properties of the event, property name -> (parameters, value).
+              Only the first value of a property is kept, EXDATE values are collected to list
+    """
+    event: dict = None
+    nesting: int = 0
+
+    for line in _unfold(source):
+        name, params, value = _parse_line(line)
+
+        if name == 'BEGIN':
+            if value.upper() == 'VEVENT' and event is None:
+                event = {}
+            elif event is not None:
+                # Nested components like VALARM are skipped
+                nesting += 1
+        elif name == 'END':
+            if nesting:
+                nesting -= 1
+            elif value.upper() == 'VEVENT' and event is not None:
+                yield event
+                event = None
+        elif event is not None and not nesting:
+            if name == 'EXDATE':
+                event.setdefault(name, []).append((params, value))
+            else:
+                event.setdefault(name, (params, value))
+
+
+def event_to_record(event: dict, event_id: int, channel_id: int) -> EventRecord:
+    """
+    Converts imported event to event record.
+    Times with TZID parameter and floating times are taken as UTC,
+    durations are clamped to MAX_EVENT_DURATION
+
+    Args:
+        event (dict): parsed event
+        event_id (int): id given to the event, can be None and set later
+        channel_id (int): channel where the event is announced
+
+    Raises:
+        ValueError: If the event has no valid start or its recurrence rule is not supported
+
+    Returns:
+        EventRecord: event record
+    """
+    if 'DTSTART' not in event:
+        raise ValueError('Event has no DTSTART')
+
+    start: float = _parse_time(event['DTSTART'][1])
+
+    duration: float = 0.0
+    if 'DTEND' in event:
+        duration = _parse_time(event['DTEND'][1]) - start
+    elif 'DURATION' in event:
+        duration = _parse_duration(event['DURATION'][1])
+
+    description: str = _unescape(event.get('SUMMARY', event.get('DESCRIPTION', ({}, '')))[1])
+
+    recurrence: Recurrence = None
+    if 'RRULE' in event:
+        recurrence = _parse_rrule(event['RRULE'][1], start)
+
+    if recurrence is not None and 'EXDATE' in event:
+        exceptions: frozenset = frozenset(
+            _parse_time(value)
+            for _, values in event['EXDATE'] for value in values.split(','))
+        recurrence = recurrence._replace(exceptions=exceptions)
+
+    return EventRecord(
+        id=event_id,
+        time=start,
+        description=description,
+        channel_id=channel_id,
+        doc_id=None if event_id is None else str(event_id),
+        recurrence=recurrence,
+        duration=min(max(duration, 0.0), MAX_EVENT_DURATION)
+    )
+
+
+def _unfold(source: IO[str]) -> Iterator[str]:
+    # Continuation lines start with single space or tab
+    current: str = None
+
+    for raw_line in source:
+        line: str = raw_line.rstrip('\r\n')
+
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+
+        if current:
+            yield current
+        current = line
+
+    if current:
+        yield current
+
+
+def _parse_line(line: str) -> tuple:
+    # NAME;PARAM=VALUE;PARAM=VALUE:value, colons inside quoted parameters are not separators
+    quoted: bool = False
+    for position, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ':' and not quoted:
+            break
+    else:
+        return line.upper(), {}, ''
+
+    name, *raw_params = line[:position].split(';')
+    params: dict = {}
+    for raw_param in raw_params:
+        key, _, param_value = raw_param.partition('=')
+        params[key.upper()] = param_value.strip('"')
+
+    return name.upper(), params, line[position + 1:]
+
+
+def _parse_time(value: str) -> float:
+    value = value.strip()
+
+    if 'T' not in value:
+        # All day events start at midnight
+        return datetime.strptime(value, '%Y%m%d').replace(tzinfo=timezone.utc).timestamp()
+
+    return datetime.strptime(
+        value.rstrip('Z'), '%Y%m%dT%H%M%S').replace(tzinfo=timezone.utc).timestamp()
+
+
+def _parse_duration(value: str) -> float:
+    match = DURATION_PATTERN.match(value.strip().upper())
+
+    if match is None:
+        raise ValueError(f'Invalid duration {value}')
+
+    parts: dict = {name: int(amount or 0) for name, amount in match.groupdict().items()}
+    return float(
+        (parts['weeks'] * 7 + parts['days']) * 86400
+        + parts['hours'] * 3600 + parts['minutes'] * 60 + parts['seconds'])
+
+
+def _format_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime(ICAL_TIME_FORMAT)
+
+
+def _parse_rrule(value: str, start: float) -> Recurrence:
+    """
+    Converts RRULE to recurrence rule, COUNT is converted to the time of the last occurrence.
+    BYDAY and BYMONTHDAY are accepted only if they repeat the day of the first occurrence
+
+    Args:
+        value (str): RRULE value
+        start (float): POSIX timestamp of the first occurrence
+
+    Raises:
+        ValueError: If the rule has parts or frequency that are not supported
+
+    Returns:
+        Recurrence: recurrence rule
+    """
+    parts: dict = dict(
+        part.partition('=')[::2] for part in value.upper().split(';') if part)
+
+    unsupported: set = set(parts) - SUPPORTED_RRULE_PARTS
+    if unsupported:
+        raise ValueError(f'Unsupported RRULE parts {", ".join(sorted(unsupported))}')
+
+    freq: str = parts.get('FREQ', '').lower()
+    if freq not in FREQUENCIES:
+        raise ValueError(f'Unsupported RRULE frequency {freq or "none"}')
+
+    first: datetime = datetime.fromtimestamp(start, tz=timezone.utc)
+
+    if 'BYDAY' in parts and (freq != 'weekly' or parts['BYDAY'] != WEEKDAYS[first.weekday()]):
+        raise ValueError(f'Unsupported RRULE BYDAY={parts["BYDAY"]}')
+
+    if 'BYMONTHDAY' in parts and (freq != 'monthly' or parts['BYMONTHDAY'] != str(first.day)):
+        raise ValueError(f'Unsupported RRULE BYMONTHDAY={parts["BYMONTHDAY"]}')
+
+    if 'COUNT' in parts and 'UNTIL' in parts:
+        raise ValueError('RRULE can not have both COUNT and UNTIL')
+
+    until: str = parts.get('UNTIL')
+
+    recurrence = Recurrence(
+        freq=freq,
+        interval=max(int(parts.get('INTERVAL', 1)), 1),
+        until=None if until is None else _parse_time(until)
+    )
+
+    if 'COUNT' in parts:
+        count: int = int(parts['COUNT'])
+        if count < 1:
+            raise ValueError(f'Invalid RRULE COUNT={count}')
+
+        # EXDATE removes occurrences from the set counted by COUNT, so it is applied later
+        last: float = next(islice(occurrences(start, recurrence, start), count - 1, None))
+        recurrence = recurrence._replace(until=last)
+
+    return recurrence
+
+
+def _format_rrule(recurrence: Recurrence) -> str:
+    rule: str = f'FREQ={recurrence.freq.upper()};INTERVAL={recurrence.interval}'
+
+    if recurrence.until is not None:
+        rule += f';UNTIL={_format_time(recurrence.until)}'
+
+    return rule
+
+
+def _escape(text: str) -> str:
+    return (text.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def _unescape(text: str) -> str:
+    result: list = []
+    chars: Iterator[str] = iter(text)
+
+    for char in chars:
+        if char != '\\':
+            result.append(char)
+            continue
+
+        escaped: str = next(chars, '')
+        result.append('\n' if escaped in ('n', 'N') else escaped)
+
+    return ''.join(result)
+
+
+def _write_line(output: IO[str], line: str) -> None:
+    # Fold the line so no part is longer than MAX_LINE_OCTETS, multi-byte characters are not split
+    parts: list = []
+    current: str = ''
+    current_octets: int = 0
+
+    for char in line:
+        char_octets: int = len(char.encode('utf-8'))
+
+        if current_octets + char_octets > MAX_LINE_OCTETS:
+            parts.append(current)
+            # Continuation lines start with space which counts to their length
+            current, current_octets = ' ', 1
+
+        current += char
+        current_octets += char_octets
+
+    parts.append(current)
+    output.write('\r\n'.join(parts) + '\r\n')
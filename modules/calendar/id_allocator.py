@@ -0,0 +1,137 @@
+"""
+Allocation of unique calendar event ids.
+Every guild has counter document that is advanced transactionally by whole blocks of ids,
+ids from the reserved block are then issued locally without any firestore round trip
+"""
+
+# Library includes
+import asyncio
+
+from firebase_admin import firestore
+
+# Typing info
+from google.cloud.firestore import Client as FirestoreClient
+from google.cloud.firestore import DocumentReference, Transaction
+
+# App includes
+from app.logging.core import Log
+from app.single_flight import SingleFlight
+
+
+# Lowest id that is ever issued
+FIRST_EVENT_ID: int = 1000
+
+
+class IdAllocator:
+    """
+    Issues unique event ids from blocks reserved in per guild counter documents
+
+    Args:
+        block_size (int, optional): number of ids reserved with single transaction. Defaults to 20.
+    """
+
+    def __init__(self, *, block_size: int = 20) -> None:
+        self.block_size: int = block_size
+
+        # guild id -> [next id, end of the block]
+        self._blocks: dict = {}
+
+        # Reservations that are in flight, keyed by guild id
+        self._reservations = SingleFlight()
+
+    async def next_id(self, guild_id: int) -> int:
+        """
+        Coroutine that returns unique event id for the guild.
+        Firestore is accessed only when the local block is exhausted
+
+        Args:
+            guild_id (int): guild id
+
+        Returns:
+            int: event id
+        """
+        while True:
+            block: list = self._blocks.get(guild_id)
+
+            if block is not None and block[0] < block[1]:
+                event_id: int = block[0]
+                block[0] += 1
+                return event_id
+
+            # Concurrent callers wait for the same reservation
+            await self._reservations.do(guild_id, self._reserve, guild_id)
+
+    async def reserve(self, guild_id: int, count: int) -> range:
+        """
+        Coroutine that reserves continuous range of ids with single transaction,
+        used when many events are created at once
+
+        Args:
+            guild_id (int): guild id
+            count (int): number of ids
+
+        Returns:
+            range: reserved ids
+        """
+        loop = asyncio.get_event_loop()
+        start: int = await loop.run_in_executor(None, _reserve_block, guild_id, count)
+        return range(start, start + count)
+
+    async def _reserve(self, guild_id: int) -> None:
+        loop = asyncio.get_event_loop()
+        start: int = await loop.run_in_executor(None, _reserve_block, guild_id, self.block_size)
+        self._blocks[guild_id] = [start, start + self.block_size]
+
+
+def _reserve_block(guild_id: int, size: int) -> int:
+    """
+    Advances guild counter document by size in a transaction.
+    This call is blocking and should be run in executor
+
+    Args:
+        guild_id (int): guild id
+        size (int): number of ids to reserve
+
+    Returns:
+        int: first reserved id
+    """
+    Log.debug('Reserving %s calendar event ids in guild %s', size, guild_id)
+
+    db_client: FirestoreClient = firestore.client()
+    counter_ref: DocumentReference = db_client.document(
+        f'bot-root/{guild_id}/calendar-meta/id-counter')
+
+    return _advance_counter(db_client.transaction(), counter_ref, guild_id, size)
+
+
+@firestore.transactional
+def _advance_counter(transaction: Transaction, counter_ref: DocumentReference,
+                     guild_id: int, size: int) -> int:
+    snapshot = counter_ref.get(transaction=transaction)
+
+    if snapshot.exists:
+        start: int = snapshot.get('next_id')
+    else:
+        start: int = _first_free_id(transaction, guild_id)
+
+    transaction.set(counter_ref, {'next_id': start + size})
+    return start
+
+
+def _first_free_id(transaction: Transaction, guild_id: int) -> int:
+    """
+    Returns id following the highest id used by existing events,
+    so the counter does not collide with randomly generated ids
+
+    Args:
+        transaction (Transaction): transaction the query is part of
+        guild_id (int): guild id
+    """
+    db_client: FirestoreClient = firestore.client()
+    query = db_client.collection(f'bot-root/{guild_id}/calendar-events').order_by(
+        u'id', direction=firestore.Query.DESCENDING).limit(1)
+
+    for doc in query.stream(transaction=transaction):
+        return max(doc.get('id') + 1, FIRST_EVENT_ID)
+
+    return FIRST_EVENT_ID
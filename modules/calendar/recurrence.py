@@ -0,0 +1,149 @@
+"""
+Recurring calendar events. Recurring event is stored as single rule document
+and its occurrences are generated lazily only for the time window that is being queried
+"""
+
+# Library includes
+from calendar import monthrange
+from datetime import datetime, timezone
+from typing import Iterator, NamedTuple
+import math
+
+
+# Supported frequencies and their step in seconds, monthly step is computed from calendar
+FREQUENCIES: dict = {
+    'daily': 86400.0,
+    'weekly': 7 * 86400.0,
+    'monthly': None,
+}
+
+
+class Recurrence(NamedTuple):
+    """
+    Compact recurrence rule, times are POSIX timestamps
+
+    Fields:
+        freq        [daily/weekly/monthly]
+        interval    number of frequency units between occurrences
+        until       time of the last possible occurrence, None means forever
+        exceptions  start times of occurrences that are skipped
+    """
+    freq: str
+    interval: int = 1
+    until: float = None
+    exceptions: frozenset = frozenset()
+
+
+def recurrence_from_document(document: dict) -> Recurrence:
+    """
+    Creates recurrence rule from its firestore representation
+
+    Args:
+        document (dict): recurrence field of event document, may be None
+
+    Returns:
+        Recurrence: recurrence rule, None if the event does not recur
+    """
+    if not document:
+        return None
+
+    until = document.get('until')
+
+    return Recurrence(
+        freq=document['freq'],
+        interval=document.get('interval', 1),
+        until=None if until is None else until.timestamp(),
+        exceptions=frozenset(value.timestamp() for value in document.get('exceptions', ()))
+    )
+
+
+def recurrence_to_document(recurrence: Recurrence) -> dict:
+    """
+    Converts recurrence rule to its firestore representation
+
+    Args:
+        recurrence (Recurrence): recurrence rule, may be None
+
+    Returns:
+        dict: recurrence field of event document, None if the event does not recur
+    """
+    if recurrence is None:
+        return None
+
+    return {
+        'freq': recurrence.freq,
+        'interval': recurrence.interval,
+        'until': None if recurrence.until is None else _to_datetime(recurrence.until),
+        'exceptions': sorted(_to_datetime(value) for value in recurrence.exceptions),
+    }
+
+
+def occurrences(first: float, recurrence: Recurrence, start: float,
+                end: float = None) -> Iterator[float]:
+    """
+    Lazily generates occurrence times of recurring event in the range [start, end)
+
+    Args:
+        first (float): POSIX timestamp of the first occurrence
+        recurrence (Recurrence): recurrence rule
+        start (float): POSIX timestamp, occurrences before it are skipped without generating them
+        end (float, optional): POSIX timestamp, None means no upper bound
+
+    Yields:
+        float: POSIX timestamps of occurrences in ascending order
+    """
+    step: float = FREQUENCIES[recurrence.freq]
+    interval: int = max(recurrence.interval, 1)
+
+    if step is None:
+        position: Iterator[float] = _monthly(first, interval, start)
+    else:
+        position = _fixed_step(first, step * interval, start)
+
+    for occurrence in position:
+        if end is not None and occurrence >= end:
+            return
+
+        if recurrence.until is not None and occurrence > recurrence.until:
+            return
+
+        if occurrence not in recurrence.exceptions:
+            yield occurrence
+
+
+def _fixed_step(first: float, step: float, start: float) -> Iterator[float]:
+    # Jump straight to the first occurrence not before start
+    index: int = max(0, math.ceil((start - first) / step))
+
+    while True:
+        yield first + index * step
+        index += 1
+
+
+def _monthly(first: float, interval: int, start: float) -> Iterator[float]:
+    first_date: datetime = _to_datetime(first)
+    start_date: datetime = _to_datetime(max(start, first))
+
+    # Jump close to start, one period before it to be safe with short months
+    months: int = (start_date.year - first_date.year) * 12 + start_date.month - first_date.month
+    index: int = max(0, months // interval - 1)
+
+    while True:
+        occurrence: float = _add_months(first_date, index * interval).timestamp()
+        index += 1
+
+        if occurrence >= start:
+            yield occurrence
+
+
+def _add_months(date: datetime, months: int) -> datetime:
+    # Day of month is clamped, event on 31st happens on the last day of shorter months
+    month_index: int = date.month - 1 + months
+    year: int = date.year + month_index // 12
+    month: int = month_index % 12 + 1
+    day: int = min(date.day, monthrange(year, month)[1])
+    return date.replace(year=year, month=month, day=day)
+
+
+def _to_datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
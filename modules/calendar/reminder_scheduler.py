@@ -0,0 +1,348 @@
+"""
+Process wide scheduler firing calendar events when their time arrives.
+All upcoming events of every guild are kept in single min-heap served by single wake-up timer.
+Only events from the next time window are loaded from firestore, events further in the future
+are loaded once the window advances. Recurring event has at most one pending occurrence,
+the following one is scheduled when it fires. Active recurring events are read only once
+at start and then kept in memory, updated by schedule() and cancel()
+"""
+
+# Library includes
+from datetime import datetime, timezone
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Callable, Iterator, List
+
+from firebase_admin import firestore
+from google.api_core.exceptions import GoogleAPIError
+
+# Typing info
+from google.cloud.firestore import Client as FirestoreClient
+
+# App includes
+from app.logging.core import Log
+from app.write_behind import write_queue
+from modules.calendar.event_index import EventRecord, expand_record, record_from_document
+
+
+# Length in seconds of the time window loaded from firestore at once
+SCHEDULER_WINDOW: float = 3600.0
+
+# Next window is loaded this many seconds before the current one ends
+WINDOW_MARGIN: float = 60.0
+
+# Seconds to wait before retrying failed window load
+RETRY_DELAY: float = 30.0
+
+
+class ReminderScheduler:
+    """
+    Min-heap of (fire time, sequence, guild id, record) entries with single timer.
+    Cancelled entries are only marked and skipped when they reach the top of the heap,
+    so scheduling and cancelling both cost O(log n)
+
+    Args:
+        window (float, optional): length of loaded time window. Defaults to SCHEDULER_WINDOW.
+    """
+
+    def __init__(self, *, window: float = SCHEDULER_WINDOW) -> None:
+        self.window: float = window
+
+        # Short windows can't be loaded too early
+        self._margin: float = min(WINDOW_MARGIN, window / 2)
+
+        self._heap: list = []
+
+        # (guild id, event id) -> heap entry
+        self._entries: dict = {}
+
+        # Tie breaker for entries firing at the same time
+        self._sequence = itertools.count()
+
+        # Events starting before this time are loaded into the heap
+        self._window_end: float = 0.0
+
+        # Keys cancelled while the window was loading
+        self._cancelled_keys: set = set()
+
+        # (guild id, event id) -> (guild id, record) of recurring events that did not end
+        self._rules: dict = {}
+        self._rules_loaded: bool = False
+
+        self._callback: Callable = None
+        self._runner: asyncio.Task = None
+        self._wakeup: asyncio.Event = None
+
+    def start(self, callback: Callable) -> None:
+        """
+        Starts the scheduler
+
+        Args:
+            callback (Callable): function called with (guild id, EventRecord) when event is due
+        """
+        if self._runner is not None:
+            return
+
+        self._callback = callback
+        self._window_end = time.time()
+        self._wakeup = asyncio.Event()
+        self._runner = asyncio.ensure_future(self._run())
+
+    def stop(self) -> None:
+        """
+        Stops the scheduler and forgets every scheduled event
+        """
+        if self._runner is None:
+            return
+
+        self._runner.cancel()
+        self._runner = None
+        self._heap.clear()
+        self._entries.clear()
+        self._rules.clear()
+        self._rules_loaded = False
+
+    def schedule(self, guild_id: int, record: EventRecord) -> None:
+        """
+        Schedules the event or reschedules it if it was scheduled already.
+        Events outside of the loaded window are picked up when the window advances
+
+        Args:
+            guild_id (int): guild id
+            record (EventRecord): event record
+        """
+        if self._runner is None:
+            return
+
+        self.cancel(guild_id, record.id)
+
+        if record.recurrence is not None:
+            self._rules[(guild_id, record.id)] = (guild_id, record)
+
+        # Past events are not announced, future ones are loaded with their window
+        entry: list = self._push(guild_id, record, time.time())
+
+        # New event fires sooner than the timer is set to
+        if entry is not None and self._heap[0] is entry:
+            self._wakeup.set()
+
+    def cancel(self, guild_id: int, event_id: int) -> None:
+        """
+        Cancels scheduled event
+
+        Args:
+            guild_id (int): guild id
+            event_id (int): event id
+        """
+        key: tuple = (guild_id, event_id)
+        entry: list = self._entries.pop(key, None)
+
+        if entry is not None:
+            entry[-1] = None
+
+        self._rules.pop(key, None)
+        self._cancelled_keys.add(key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def _run(self) -> None:
+        # Single runner serves every guild, so no error may stop it
+        while True:
+            try:
+                await self._step()
+            except Exception:  # pylint: disable=broad-except
+                Log.error('Calendar scheduler failed, retrying', exc_info=True)
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def _step(self) -> None:
+        """
+        Loads the next window, fires the earliest due event or waits for one
+        """
+        now: float = time.time()
+
+        if now >= self._window_end - self._margin:
+            await self._load_window()
+            return
+
+        # Drop cancelled entries from the top
+        while self._heap and self._heap[0][-1] is None:
+            heapq.heappop(self._heap)
+
+        if self._heap and self._heap[0][0] <= now:
+            self._fire(heapq.heappop(self._heap))
+            return
+
+        timeout: float = self._window_end - self._margin - now
+        if self._heap:
+            timeout = min(timeout, self._heap[0][0] - now)
+
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _load_window(self) -> None:
+        start: float = self._window_end
+        end: float = time.time() + self.window
+
+        # Events created from now on are scheduled directly
+        self._window_end = end
+        self._cancelled_keys.clear()
+
+        # Make sure recently created events are already in firestore
+        await write_queue.flush()
+
+        loop = asyncio.get_event_loop()
+
+        rules: list = []
+
+        try:
+            events: list = await loop.run_in_executor(None, _load_single_events, start, end)
+
+            if not self._rules_loaded:
+                rules = await loop.run_in_executor(None, _load_active_rules, start)
+        except GoogleAPIError as exc:
+            Log.error('Could not load calendar events for scheduling: %s', exc)
+            self._window_end = start
+            await asyncio.sleep(RETRY_DELAY)
+            return
+        except Exception:  # pylint: disable=broad-except
+            # The window is loaded again, so its events are not skipped
+            Log.error('Could not load calendar events for scheduling', exc_info=True)
+            self._window_end = start
+            await asyncio.sleep(RETRY_DELAY)
+            return
+
+        if not self._rules_loaded:
+            self._rules_loaded = True
+
+            for guild_id, record in rules:
+                key = (guild_id, record.id)
+
+                # Local changes made during the load are newer
+                if key not in self._rules and key not in self._cancelled_keys:
+                    self._rules[key] = (guild_id, record)
+
+        # Rules ended before the window are not needed anymore
+        for key, (guild_id, record) in list(self._rules.items()):
+            if record.recurrence.until is not None and record.recurrence.until < start:
+                del self._rules[key]
+
+        events.extend(self._rules.values())
+
+        for guild_id, record in events:
+            key: tuple = (guild_id, record.id)
+
+            # Local changes made during the load are newer
+            if key in self._entries or key in self._cancelled_keys:
+                continue
+
+            self._push(guild_id, record, start)
+
+        Log.debug('Scheduled %s calendar events, %s pending', len(events), len(self._entries))
+
+    def _push(self, guild_id: int, record: EventRecord, start: float) -> list:
+        """
+        Pushes the first occurrence of the event in the range [start, window end) to the heap
+
+        Returns:
+            list: heap entry, None if the event has no occurrence in the range
+        """
+        occurrence: EventRecord = next(
+            expand_record(record, start, self._window_end), None)
+
+        if occurrence is None:
+            return None
+
+        entry: list = [occurrence.time, next(self._sequence), guild_id, record]
+        self._entries[(guild_id, record.id)] = entry
+        heapq.heappush(self._heap, entry)
+        return entry
+
+    def _fire(self, entry: list) -> None:
+        fire_time, _, guild_id, record = entry
+        self._entries.pop((guild_id, record.id), None)
+
+        try:
+            self._callback(guild_id, record._replace(time=fire_time))
+        except Exception as exc:  # pylint: disable=broad-except
+            Log.error('Calendar event %s callback failed: %s', record.id, exc)
+
+        # Schedule the following occurrence of recurring event
+        if record.recurrence is not None:
+            self._push(guild_id, record, fire_time + 1)
+
+
+def _load_single_events(start: float, end: float) -> List[tuple]:
+    """
+    Reads events of all guilds starting in the range [start, end) that do not recur
+    using collection group query. This call is blocking and should be run in executor.
+    Requires collection group single-field index on time of calendar-events
+
+    Args:
+        start (float): POSIX timestamp
+        end (float): POSIX timestamp
+
+    Returns:
+        List[tuple]: (guild id, EventRecord) pairs
+    """
+    db_client: FirestoreClient = firestore.client()
+
+    query = db_client.collection_group('calendar-events').where(
+        u'time', u'>=', _to_datetime(start)).where(u'time', u'<', _to_datetime(end))
+
+    # Recurring events are expanded from the rules kept in memory
+    return [(guild_id, record) for guild_id, record in _read_events(query)
+            if record.recurrence is None]
+
+
+def _load_active_rules(start: float) -> List[tuple]:
+    """
+    Reads recurring events of all guilds that may still occur at start or later.
+    Rules without until are stored with ENDLESS_RECURRENCE end, so they match as well.
+    This call is blocking and should be run in executor.
+    Requires collection group single-field index on recurrence_end of calendar-events
+
+    Args:
+        start (float): POSIX timestamp
+
+    Returns:
+        List[tuple]: (guild id, EventRecord) pairs
+    """
+    db_client: FirestoreClient = firestore.client()
+
+    query = db_client.collection_group('calendar-events').where(
+        u'recurrence_end', u'>=', _to_datetime(start))
+
+    return [(guild_id, record) for guild_id, record in _read_events(query)
+            if record.recurrence is not None]
+
+
+def _read_events(query) -> Iterator[tuple]:
+    """
+    Reads events returned by collection group query, malformed documents are skipped
+
+    Args:
+        query: firestore query
+
+    Yields:
+        tuple: (guild id, EventRecord) pairs
+    """
+    for doc in query.stream():
+        # Path is bot-root/{guild_id}/calendar-events/{event}
+        try:
+            guild_id: int = int(doc.reference.parent.parent.id)
+            record: EventRecord = record_from_document(doc.id, doc.to_dict())
+        except (KeyError, TypeError, ValueError, AttributeError) as exc:
+            Log.warning('Skipping malformed calendar event %s: %r', doc.reference.path, exc)
+            continue
+
+        yield guild_id, record
+
+
+def _to_datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
@@ -0,0 +1,309 @@
+"""
+Reaction based RSVP on calendar event posts.
+Reactions only update in-memory attendance of the event, the latest state of every user
+is written periodically with single batch, so every event costs at most one document write
+per flush no matter how many reactions it received
+"""
+
+# Library includes
+from typing import Dict, List
+import asyncio
+
+from firebase_admin import firestore
+
+# Typing info
+from google.cloud.firestore import Client as FirestoreClient
+from google.cloud.firestore import WriteBatch
+
+# App includes
+from app.cache import TTLCache
+from app.logging.core import Log
+from app.single_flight import SingleFlight
+from app.write_behind import write_queue, MAX_BATCH_SIZE, RETRYABLE_ERRORS
+
+
+# Reaction that marks the user as attending
+RSVP_EMOJI: str = '\u2705'
+
+# Seconds between flushes of attendance changes
+RSVP_FLUSH_INTERVAL: float = 10.0
+
+# Maximal number of cached message -> event mappings
+RSVP_POST_CACHE_SIZE: int = 10000
+
+# Seconds after which message that is not RSVP post is looked up again
+RSVP_NEGATIVE_TTL: float = 600.0
+
+
+class RsvpTracker:
+    """
+    Aggregates RSVP reactions per event. Pending changes are kept as the latest state of every
+    user that reacted since the last flush. Attendance is stored as set of users,
+    so repeated reactions of the same user never change the attendee count
+
+    Args:
+        flush_interval (float, optional): seconds between flushes. Defaults to RSVP_FLUSH_INTERVAL.
+    """
+
+    def __init__(self, *, flush_interval: float = RSVP_FLUSH_INTERVAL) -> None:
+        self.flush_interval: float = flush_interval
+
+        # message id -> (guild id, event id), messages that are not RSVP posts are negative
+        self.posts: TTLCache = TTLCache(
+            max_size=RSVP_POST_CACHE_SIZE, ttl=None, negative_ttl=RSVP_NEGATIVE_TTL)
+        self._lookups = SingleFlight()
+
+        # (guild id, event id) -> {user id -> attending}
+        self._pending: Dict[tuple, Dict[int, bool]] = {}
+
+        self._runner: asyncio.Task = None
+        self._flush_lock: asyncio.Lock = None
+
+        # Statistics
+        self.reactions: int = 0
+        self.writes: int = 0
+
+    def register_post(self, message_id: int, guild_id: int, event_id: int) -> None:
+        """
+        Marks the message as RSVP post of the event
+
+        Args:
+            message_id (int): message id
+            guild_id (int): guild id
+            event_id (int): event id
+        """
+        self.posts.set(message_id, (guild_id, event_id))
+        write_queue.create(_post_path(guild_id, message_id), {'event_id': event_id})
+
+    async def resolve_post(self, guild_id: int, message_id: int) -> tuple:
+        """
+        Coroutine that returns the event the message is RSVP post of
+
+        Args:
+            guild_id (int): guild id
+            message_id (int): message id
+
+        Returns:
+            tuple: (guild id, event id), None if the message is not RSVP post
+        """
+        if message_id in self.posts:
+            return self.posts.get(message_id)
+
+        event_id: int = await self._lookups.do_in_executor(
+            message_id, _read_post, guild_id, message_id)
+
+        if event_id is None:
+            self.posts.set(message_id, None, negative=True)
+            return None
+
+        self.posts.set(message_id, (guild_id, event_id))
+        return guild_id, event_id
+
+    def record(self, guild_id: int, event_id: int, user_id: int, attending: bool) -> None:
+        """
+        Records reaction of the user. The latest reaction of the user wins,
+        also when the event has more RSVP posts
+
+        Args:
+            guild_id (int): guild id
+            event_id (int): event id
+            user_id (int): user id
+            attending (bool): True if the reaction was added, False if removed
+        """
+        key: tuple = (guild_id, event_id)
+
+        self._pending.setdefault(key, {})[user_id] = attending
+        self.reactions += 1
+
+        if self._runner is None:
+            self._runner = asyncio.ensure_future(self._run())
+
+    async def clear(self, guild_id: int, event_id: int) -> None:
+        """
+        Coroutine that marks every attending user as not attending,
+        used when RSVP reactions are removed from the post at once
+
+        Args:
+            guild_id (int): guild id
+            event_id (int): event id
+        """
+        for user_id in await self.attendees(guild_id, event_id):
+            self.record(guild_id, event_id, user_id, False)
+
+    async def attendees(self, guild_id: int, event_id: int) -> List[int]:
+        """
+        Coroutine that returns ids of attending users including changes that are not flushed yet
+
+        Args:
+            guild_id (int): guild id
+            event_id (int): event id
+
+        Returns:
+            List[int]: user ids
+        """
+        loop = asyncio.get_event_loop()
+        stored: dict = await loop.run_in_executor(None, _read_attendance, guild_id, event_id)
+
+        users: set = {int(user_id) for user_id in stored.get('attendees', {})}
+
+        for user_id, attending in self._pending.get((guild_id, event_id), {}).items():
+            if attending:
+                users.add(user_id)
+            else:
+                users.discard(user_id)
+
+        return sorted(users)
+
+    async def flush(self) -> None:
+        """
+        Coroutine that writes pending attendance changes
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            pending, self._pending = self._pending, {}
+
+            loop = asyncio.get_event_loop()
+            items: list = list(pending.items())
+
+            for start in range(0, len(items), MAX_BATCH_SIZE):
+                chunk: list = items[start:start + MAX_BATCH_SIZE]
+
+                try:
+                    await loop.run_in_executor(None, _commit_attendance, chunk)
+                except RETRYABLE_ERRORS as exc:
+                    Log.warning('Could not write attendance of %s events: %s', len(chunk), exc)
+                    self._requeue(chunk)
+                    continue
+                except Exception:  # pylint: disable=broad-except
+                    # Single rejected document fails the whole batch, the others are saved
+                    Log.error('Could not write attendance of %s events, writing them one by one',
+                              len(chunk), exc_info=True)
+                    await self._commit_each(chunk)
+                    continue
+                except BaseException:
+                    # Cancelled flush keeps changes that were not written yet
+                    self._requeue(items[start:])
+                    raise
+
+                self.writes += len(chunk)
+
+    async def _commit_each(self, chunk: list) -> None:
+        """
+        Coroutine that writes attendance of the events one by one,
+        changes rejected by firestore are dropped
+
+        Args:
+            chunk (list): list of ((guild id, event id), {user id -> attending})
+        """
+        loop = asyncio.get_event_loop()
+
+        for index, item in enumerate(chunk):
+            try:
+                await loop.run_in_executor(None, _commit_attendance, [item])
+            except RETRYABLE_ERRORS:
+                self._requeue([item])
+                continue
+            except Exception as exc:  # pylint: disable=broad-except
+                Log.error('Dropping rejected attendance of event %s: %r', item[0], exc)
+                continue
+            except BaseException:
+                self._requeue(chunk[index:])
+                raise
+
+            self.writes += 1
+
+    async def close(self) -> None:
+        """
+        Coroutine that stops periodic flushing and writes remaining changes
+        """
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+
+        await self.flush()
+
+    def stats(self) -> dict:
+        """
+        Returns tracker statistics
+
+        Returns:
+            dict: pending events, recorded reactions and written documents
+        """
+        return {
+            'pending': len(self._pending),
+            'reactions': self.reactions,
+            'writes': self.writes,
+        }
+
+    def _requeue(self, chunk: list) -> None:
+        # States recorded in the meantime are newer
+        for key, users in chunk:
+            self._pending[key] = {**users, **self._pending.get(key, {})}
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+
+            # Stopping the runner must not abandon changes that are being written.
+            # Failed flush must not stop later flushes
+            try:
+                await asyncio.shield(self.flush())
+            except Exception:  # pylint: disable=broad-except
+                Log.error('Flushing of attendance changes failed', exc_info=True)
+
+
+def _commit_attendance(chunk: list) -> None:
+    """
+    Writes attendance changes of up to MAX_BATCH_SIZE events with single batch.
+    This call is blocking and should be run in executor
+
+    Args:
+        chunk (list): list of ((guild id, event id), {user id -> attending})
+    """
+    db_client: FirestoreClient = firestore.client()
+    batch: WriteBatch = db_client.batch()
+
+    # Setting and deleting map keys is idempotent, the count is the size of the map
+    for (guild_id, event_id), users in chunk:
+        attendees: dict = {
+            str(user_id): True if attending else firestore.DELETE_FIELD
+            for user_id, attending in users.items()}
+
+        batch.set(db_client.document(_attendance_path(guild_id, event_id)), {
+            'attendees': attendees,
+        }, merge=True)
+
+    batch.commit()
+
+
+def _read_post(guild_id: int, message_id: int) -> int:
+    # Blocking read of the event id of RSVP post, None if the message is not RSVP post
+    db_client: FirestoreClient = firestore.client()
+    document = db_client.document(_post_path(guild_id, message_id)).get()
+
+    return document.get('event_id') if document.exists else None
+
+
+def _read_attendance(guild_id: int, event_id: int) -> dict:
+    # Blocking read of the stored attendance of the event
+    db_client: FirestoreClient = firestore.client()
+    document = db_client.document(_attendance_path(guild_id, event_id)).get()
+
+    return document.to_dict() or {}
+
+
+def _post_path(guild_id: int, message_id: int) -> str:
+    return f'bot-root/{guild_id}/calendar-posts/{message_id}'
+
+
+def _attendance_path(guild_id: int, event_id: int) -> str:
+    return f'bot-root/{guild_id}/calendar-rsvp/{event_id}'
+
+
+# Aggregates RSVP reactions of all guilds
+rsvp_tracker = RsvpTracker()
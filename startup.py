@@ -32,7 +32,7 @@ def main() -> None:
     # List the given configuration
     Log.warning('Listing bot configuration:')
     for key, value in bot_configuration.__dict__.items():
-        Log.warning(f'\t{key}: {value}')
+        Log.warning('\t%s: %s', key, value)
     Log.warning('End of configuration')
 
     # Setting up the firebase